@@ -5,10 +5,25 @@ import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from pathlib import Path
+from scipy.signal import lfilter
 from scipy.stats import binomtest
 from assets import ASSET_CATEGORIES, get_all_assets_flat
+import functools
+import hashlib
+import os
+import re
 import warnings
+try:
+    from numba import njit
+except ImportError:  # numba is a requirement; without it the scans still run, as slow Python loops
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
 warnings.filterwarnings('ignore')
 
 # ─────────────────────────────────────────────────────────────
@@ -39,51 +54,39 @@ COLORS = {
 # ─────────────────────────────────────────────────────────────
 # WICK CLASSIFICATION SYSTEM
 # ─────────────────────────────────────────────────────────────
-def classify_wick_profile(open_p, close_p, high, low):
-    body_top = max(open_p, close_p)
-    body_bot = min(open_p, close_p)
-    total_range = high - low
-    if total_range == 0:
-        return 'Doji', 0, 0, 0, close_p >= open_p
-    upper_wick = high - body_top
-    lower_wick = body_bot - low
-    body = body_top - body_bot
-    upper_pct = upper_wick / total_range * 100
-    lower_pct = lower_wick / total_range * 100
-    body_pct = body / total_range * 100
-    is_bullish = close_p > open_p
-    if body_pct < 10:
-        label = 'Doji'
-    elif upper_pct > 30 and lower_pct > 30:
-        label = 'Wicks Both Sides'
-    elif upper_pct > lower_pct * 2 and upper_pct > 20:
-        label = 'Heavy Upper Wick'
-    elif lower_pct > upper_pct * 2 and lower_pct > 20:
-        label = 'Heavy Lower Wick'
-    elif body_pct > 75:
-        label = 'Full Body (Marubozu)'
-    elif upper_pct > lower_pct + 5:
-        label = 'Slight Upper Wick'
-    elif lower_pct > upper_pct + 5:
-        label = 'Slight Lower Wick'
-    else:
-        label = 'Balanced'
-    return label, round(upper_pct, 1), round(lower_pct, 1), round(body_pct, 1), is_bullish
+# Label for each wick code, in if/elif priority order, and its coarse bucket
+WICK_LABELS = np.array(['Doji', 'Wicks Both Sides', 'Heavy Upper Wick', 'Heavy Lower Wick',
+                        'Full Body (Marubozu)', 'Slight Upper Wick', 'Slight Lower Wick', 'Balanced'], dtype=object)
+WICK_BUCKETS = np.array(['Doji', 'Both Wicks', 'Upper Wick', 'Lower Wick',
+                         'Full Body', 'Upper Wick', 'Lower Wick', 'Balanced'], dtype=object)
+
+def classify_wick_profiles(O, H, L, C):
+    """Wick profile of every candle from OHLC arrays.
+    Returns (wick code, upper wick %, lower wick %, body %, is_bullish); index WICK_LABELS /
+    WICK_BUCKETS with the code to get the label / bucket. Zero-range candles are Doji."""
+    body_top = np.maximum(O, C); body_bot = np.minimum(O, C)
+    rng = H - L
+    flat = rng == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        upper = np.where(flat, 0.0, (H - body_top) / rng * 100)
+        lower = np.where(flat, 0.0, (body_bot - L) / rng * 100)
+        body = np.where(flat, 0.0, (body_top - body_bot) / rng * 100)
+    code = np.select([body < 10,
+                      (upper > 30) & (lower > 30),
+                      (upper > lower * 2) & (upper > 20),
+                      (lower > upper * 2) & (lower > 20),
+                      body > 75,
+                      upper > lower + 5,
+                      lower > upper + 5], np.arange(7, dtype=np.int8), 7)
+    is_bullish = np.where(flat, C >= O, C > O)
+    return code, np.round(upper, 1), np.round(lower, 1), np.round(body, 1), is_bullish
 
 
 def get_scenario_key(c1_bullish, c1_wick, c2_bullish, c2_wick):
-    c1c = 'Green' if c1_bullish else 'Red'
-    c2c = 'Green' if c2_bullish else 'Red'
-    return f"C1:{c1c}/{c1_wick} -> C2:{c2c}/{c2_wick}"
-
-
-def wick_bucket(label):
-    if label in ('Heavy Upper Wick','Slight Upper Wick'): return 'Upper Wick'
-    if label in ('Heavy Lower Wick','Slight Lower Wick'): return 'Lower Wick'
-    if label == 'Full Body (Marubozu)': return 'Full Body'
-    if label == 'Wicks Both Sides': return 'Both Wicks'
-    if label == 'Doji': return 'Doji'
-    return 'Balanced'
+    """Vectorized over arrays of C1/C2 colors and wick buckets."""
+    c1c = np.where(c1_bullish, 'Green', 'Red').astype(object)
+    c2c = np.where(c2_bullish, 'Green', 'Red').astype(object)
+    return 'C1:' + c1c + '/' + c1_wick + ' -> C2:' + c2c + '/' + c2_wick
 
 
 # ─────────────────────────────────────────────────────────────
@@ -109,11 +112,7 @@ def get_major_event_dates():
         "2024-11-13","2024-12-11","2025-01-15","2025-02-12","2025-03-12",
         "2025-04-10","2025-05-13","2025-06-11","2025-07-15","2025-08-12",
         "2025-09-10","2025-10-14","2025-11-12","2025-12-10"]
-    dates = set()
-    for d in fomc + nfp + cpi:
-        try: dates.add(pd.Timestamp(d).date())
-        except: pass
-    return dates
+    return np.unique(np.array(fomc + nfp + cpi, dtype='datetime64[D]'))  # sorted, for np.isin
 
 
 # ─────────────────────────────────────────────────────────────
@@ -123,6 +122,72 @@ def get_major_event_dates():
 #   1m: 30 days | 2m,5m,15m,30m,90m: 60 days | 1h,60m: 730 days | 1d+: unlimited
 INTERVAL_MAX_DAYS = {'15m': 59, '30m': 59, '1h': 729, '4h': 729}
 
+# On-disk OHLCV cache: one parquet file per (ticker, interval, start hour, end hour).
+# Survives process restarts; the newest file for a ticker/interval is extended
+# incrementally instead of re-downloading the full history. Lives in the user cache
+# dir unless INSIDE_BAR_CACHE_DIR points elsewhere; parquet needs pyarrow.
+CACHE_DIR = Path(os.environ.get('INSIDE_BAR_CACHE_DIR')
+                 or Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'inside-bar-analyzer' / 'yf')
+CACHE_KEY_FMT = '%Y%m%d%H'
+
+def _cache_prefix(ticker, yf_interval):
+    return f"{re.sub(r'[^A-Za-z0-9.-]', '_', ticker)}_{yf_interval}"
+
+@functools.lru_cache(maxsize=64)
+def _read_parquet_cached(path):
+    return pd.read_parquet(path)
+
+def _download(ticker, start, end, yf_interval):
+    df = yf.download(ticker, start=start, end=end, interval=yf_interval, progress=False)
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    if df.empty: return df
+    df.index = pd.to_datetime(df.index)
+    if df.index.tz is not None:
+        df.index = df.index.tz_convert('UTC').tz_localize(None)
+    return df
+
+def _cached_download(ticker, start, end, yf_interval):
+    """yf.download through the parquet cache, fetching only the missing tail when possible.
+    A file extended from older history keeps that history, so switching periods never re-downloads it."""
+    prefix = _cache_prefix(ticker, yf_interval)
+    start_key, end_key = start.strftime(CACHE_KEY_FMT), end.strftime(CACHE_KEY_FMT)
+    cached = sorted(CACHE_DIR.glob(f"{prefix}_*.parquet"), reverse=True) if CACHE_DIR.exists() else []
+    df = None
+    for old in cached:
+        old_start, old_end = old.stem.rsplit('_', 2)[1:]
+        if old_start > start_key:
+            continue
+        try:
+            prev = _read_parquet_cached(str(old))
+        except (OSError, ImportError, ValueError):
+            continue  # unreadable file or no parquet engine: treat as a miss
+        if prev.empty:
+            continue
+        if old_end >= end_key:
+            return prev[prev.index >= start]
+        # Re-fetch a day of overlap so the last (possibly partial) bars get refreshed
+        delta = _download(ticker, prev.index[-1] - timedelta(days=1), end, yf_interval)
+        df = pd.concat([prev, delta]) if not delta.empty else prev.copy()
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        start_key = old_start
+        break
+    if df is None:
+        df = _download(ticker, start, end, yf_interval)
+
+    if not df.empty:
+        try:
+            CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(CACHE_DIR / f"{prefix}_{start_key}_{end_key}.parquet", compression='snappy')
+            # Drop only files this one covers; a longer-history file stays for its own period
+            for old in cached:
+                old_start, old_end = old.stem.rsplit('_', 2)[1:]
+                if old_start >= start_key and old_end <= end_key:
+                    old.unlink(missing_ok=True)
+        except (OSError, ImportError):
+            pass  # cache is best-effort (read-only filesystem, no parquet engine)
+    return df[df.index >= start]
+
 @st.cache_data(ttl=3600, show_spinner=False)
 def fetch_asset_data(ticker, interval='1h', period_years=2):
     """Fetch data respecting yfinance's per-interval limits."""
@@ -137,17 +202,53 @@ def fetch_asset_data(ticker, interval='1h', period_years=2):
         # No native 4h in yfinance — fetch 1h and resample
         yf_interval = '1h'
 
-    df = yf.download(ticker, start=start, end=end, interval=yf_interval, progress=False)
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.get_level_values(0)
-    if df.empty: return df
-    df.index = pd.to_datetime(df.index)
-    if df.index.tz is not None:
-        df.index = df.index.tz_convert('UTC').tz_localize(None)
-    return df
-
+    return _cached_download(ticker, start, end, yf_interval)
+
+def script_thread_pool(max_workers):
+    """ThreadPoolExecutor whose workers carry this script run's context, so the st.cache_data
+    functions they call work without "missing ScriptRunContext" warnings."""
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=add_script_run_ctx,
+                              initargs=(None, get_script_run_ctx()))
+
+def fetch_assets_batch(tickers, interval='1h', period_years=2, max_workers=10):
+    """Fetch several tickers concurrently (network-bound, so threads are enough).
+    Returns {ticker: DataFrame}; a failed ticker maps to the exception it raised."""
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers: return {}
+    out = {}
+    with script_thread_pool(min(max_workers, len(tickers))) as ex:
+        futs = {ex.submit(fetch_asset_data, t, interval, period_years): t for t in tickers}
+        for fut in as_completed(futs):
+            try:
+                out[futs[fut]] = fut.result()
+            except Exception as e:
+                out[futs[fut]] = e
+    return out
+
+def _frame_fingerprint(df):
+    """Cache key for a DataFrame: shape, columns and a digest of the per-row content hashes (index
+    included) in row order, so a relabelled string column or a revised bar misses the cache just
+    like a changed price does, and reordered rows do not collide."""
+    h = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return (df.shape, tuple(df.columns), hashlib.blake2b(h.tobytes(), digest_size=16).hexdigest())
+
+# Derived artifacts (4h bars, zones, setups + funnel, enrichment) are cached on a fingerprint of their
+# input frames, so a rerun only recomputes the steps whose inputs actually changed.
+cache_derived = st.cache_data(show_spinner=False, max_entries=256, hash_funcs={pd.DataFrame: _frame_fingerprint})
+# Display tables are cached on narrow projections (group keys + stat columns), which hash cheaply.
+cache_tables = st.cache_data(show_spinner=False, max_entries=64, hash_funcs={pd.DataFrame: _frame_fingerprint})
+
+@cache_derived
 def resample_to_4h(df):
-    return df.resample('4h').agg({'Open':'first','High':'max','Low':'min','Close':'last','Volume':'sum'}).dropna()
+    """OHLCV bars on a 4h grid; one resampler with a direct reduction per column."""
+    r = df.resample('4h')
+    return pd.DataFrame({'Open': r['Open'].first(), 'High': r['High'].max(), 'Low': r['Low'].min(),
+                         'Close': r['Close'].last(), 'Volume': r['Volume'].sum()}).dropna()
+
+# Timeframe dispatch: the raw yfinance interval each UI timeframe is built from,
+# and the resampler (if any) that turns those raw bars into the timeframe.
+RAW_INTERVAL = {'15m': '15m', '30m': '30m', '1H': '1h', '4H': '1h'}
+TF_RESAMPLE = {'4H': resample_to_4h}
 
 def resample_to_interval(df_1h, target):
     """Resample 1h data to 4h. For 15m/30m we fetch directly."""
@@ -156,243 +257,355 @@ def resample_to_interval(df_1h, target):
     return df_1h  # 1h stays as-is
 
 
+# ─────────────────────────────────────────────────────────────
+# INDICATORS
+# ─────────────────────────────────────────────────────────────
+def true_range(H, L, C):
+    """True range from High/Low/Close arrays (NaN on the first bar)."""
+    prev_c = np.empty_like(C); prev_c[0] = np.nan; prev_c[1:] = C[:-1]
+    return np.maximum.reduce([H - L, np.abs(H - prev_c), np.abs(L - prev_c)])
+
+def wilder_atr(tr, period=14):
+    """Wilder's ATR: seeded with the SMA of the first `period` true ranges, then the RMA
+    recursion ATR[t] = ATR[t-1] + (TR[t] - ATR[t-1]) / period run as a linear filter.
+    NaN true ranges (first bar) are skipped and stay NaN."""
+    tr = np.asarray(tr, dtype=float)
+    out = np.full(len(tr), np.nan)
+    valid = np.flatnonzero(~np.isnan(tr))
+    if len(valid) < period: return out
+    x = tr[valid]
+    atr = np.empty(len(x)); atr[:period-1] = np.nan
+    atr[period-1] = x[:period].mean()
+    k = (period - 1) / period
+    atr[period:] = lfilter([1/period], [1, -k], x[period:], zi=[atr[period-1] * k])[0]
+    out[valid] = atr
+    return out
+
+def ohlc_arrays(df):
+    """Open/High/Low/Close as float64 NumPy arrays."""
+    return tuple(df[k].to_numpy(float) for k in ('Open', 'High', 'Low', 'Close'))
+
+def atr_start(ATR, min_start=14):
+    """First index >= min_start where ATR is defined, so scans can skip the warm-up bars."""
+    valid = ~np.isnan(ATR)
+    return max(min_start, int(np.argmax(valid))) if valid.any() else len(ATR)
+
+def candle_features(df):
+    """(O, H, L, C, body, range, body/range, ATR) arrays; body ratio is NaN on zero-range candles.
+    Reads the frame without modifying it."""
+    O, H, L, C = ohlc_arrays(df)
+    body = np.abs(C - O); rng = H - L
+    with np.errstate(divide='ignore', invalid='ignore'):
+        br = np.where(rng == 0, np.nan, body / rng)
+    return O, H, L, C, body, rng, br, wilder_atr(true_range(H, L, C))
+
+
 # ─────────────────────────────────────────────────────────────
 # ZONES
 # ─────────────────────────────────────────────────────────────
+@cache_derived
 def detect_zones(df, zone_atr_min=1.5):
-    df = df.copy()
-    df['Body'] = abs(df['Close'] - df['Open'])
-    df['TR'] = np.maximum(df['High']-df['Low'], np.maximum(abs(df['High']-df['Close'].shift(1)), abs(df['Low']-df['Close'].shift(1))))
-    df['ATR'] = df['TR'].rolling(14).mean()
-    df['IsBullish'] = df['Close'] > df['Open']
-    zones = []
-    for i in range(20, len(df)):
-        r = df.iloc[i]
-        if pd.isna(r['ATR']) or r['ATR']==0 or r['Body'] < r['ATR']*zone_atr_min: continue
-        strength = r['Body'] / r['ATR']
-        if r['IsBullish']:
-            zones.append({'datetime':df.index[i],'zone_top':r['Open'],'zone_bottom':r['Low'],
-                         'zone_type':'demand','strength':round(strength,2),
-                         'origin_body':r['Body'],'origin_range':r['High']-r['Low']})
-        else:
-            zones.append({'datetime':df.index[i],'zone_top':r['High'],'zone_bottom':r['Open'],
-                         'zone_type':'supply','strength':round(strength,2),
-                         'origin_body':r['Body'],'origin_range':r['High']-r['Low']})
-    return pd.DataFrame(zones) if zones else pd.DataFrame(
-        columns=['datetime','zone_top','zone_bottom','zone_type','strength','origin_body','origin_range'])
-
-def classify_zone(dt, price, zones_df, lookback_hours=720, proximity_pct=0.003):
-    """Classify zone and return dict with zone type, distance, and strength."""
-    result = {'zone': 'neutral', 'zone_dist_pct': None, 'zone_strength': None,
-              'nearest_zone_type': None, 'nearest_zone_top': None, 'nearest_zone_bottom': None,
-              'zone_proximity_band': 'No Zone'}
-    if zones_df.empty:
-        return result
-    cutoff = dt - pd.Timedelta(hours=lookback_hours)
-    recent = zones_df[(zones_df['datetime']>=cutoff)&(zones_df['datetime']<dt)]
-    if recent.empty:
-        return result
-
-    near_s = near_d = False
-    min_dist_pct = float('inf')
-    nearest = None
-
-    for _, z in recent.iterrows():
-        # Distance to nearest edge of zone
-        if z['zone_bottom'] <= price <= z['zone_top']:
-            dist_pct = 0.0  # inside the zone
-        else:
-            dist_top = abs(price - z['zone_top']) / price
-            dist_bot = abs(price - z['zone_bottom']) / price
-            dist_pct = min(dist_top, dist_bot)
-
-        if dist_pct < min_dist_pct:
-            min_dist_pct = dist_pct
-            nearest = z
+    """Supply/demand zones from candles (after the first 20) whose body is >= zone_atr_min × ATR.
+    Bullish origin → demand zone [Low, Open]; bearish → supply zone [Open, High]."""
+    O, H, L, C, Body, Range, _, ATR = candle_features(df)
+    i = np.arange(atr_start(ATR, 20), len(df))
+    i = i[(ATR[i] > 0) & ~(Body[i] < ATR[i] * zone_atr_min)]
+    if not len(i):
+        return pd.DataFrame(columns=['datetime','zone_top','zone_bottom','zone_type','strength','origin_body','origin_range'])
+    bull = C[i] > O[i]
+    return pd.DataFrame({
+        'datetime': df.index[i],
+        'zone_top': np.where(bull, O[i], H[i]), 'zone_bottom': np.where(bull, L[i], O[i]),
+        'zone_type': np.where(bull, 'demand', 'supply').astype(object),
+        'strength': np.round(Body[i] / ATR[i], 2),
+        'origin_body': Body[i], 'origin_range': Range[i],
+    })
+
+def prepare_zone_arrays(zones_df):
+    """Sort zones by datetime and unpack the columns classify_zones_batch scans into NumPy arrays."""
+    z = zones_df.sort_values('datetime', kind='stable') if not zones_df.empty else zones_df
+    return {
+        'datetime': z['datetime'].to_numpy('datetime64[ns]'),
+        'top': z['zone_top'].to_numpy(float), 'bottom': z['zone_bottom'].to_numpy(float),
+        'type': z['zone_type'].to_numpy(object), 'strength': z['strength'].to_numpy(float),
+    }
 
-        if dist_pct <= proximity_pct:
-            if z['zone_type'] == 'supply':
-                near_s = True
+PROXIMITY_BANDS = ['Inside Zone', 'Touching (≤0.1%)', 'Very Close (0.1-0.3%)',
+                   'Near (0.3-0.6%)', 'Moderate (0.6-1%)', 'Far (>1%)', 'No Zone']
+PROXIMITY_ORDER = {b: i for i, b in enumerate(PROXIMITY_BANDS)}
+
+@njit(cache=True)
+def _nearest_zones(lo, hi, price, top, bot, is_supply, proximity_pct):
+    """For each setup, scan its zone window [lo, hi) for the nearest zone edge and
+    flag supply/demand zones within proximity_pct. nearest = -1 when the window is empty."""
+    m = len(price)
+    nearest = np.full(m, -1, np.int64); min_dist = np.full(m, np.nan)
+    near_s = np.zeros(m, np.bool_); near_d = np.zeros(m, np.bool_)
+    for i in range(m):
+        p = price[i]; best = np.inf
+        for j in range(lo[i], hi[i]):
+            if bot[j] <= p <= top[j]:
+                d = 0.0  # inside the zone
             else:
-                near_d = True
-
-    # Determine zone classification
-    if near_s and near_d:
-        zone_type = 'contested'
-    elif near_s:
-        zone_type = 'supply'
-    elif near_d:
-        zone_type = 'demand'
-    else:
-        zone_type = 'neutral'
-
-    # Proximity band for analysis dimension
-    if min_dist_pct == 0:
-        prox_band = 'Inside Zone'
-    elif min_dist_pct <= 0.001:
-        prox_band = 'Touching (≤0.1%)'
-    elif min_dist_pct <= 0.003:
-        prox_band = 'Very Close (0.1-0.3%)'
-    elif min_dist_pct <= 0.006:
-        prox_band = 'Near (0.3-0.6%)'
-    elif min_dist_pct <= 0.01:
-        prox_band = 'Moderate (0.6-1%)'
-    else:
-        prox_band = 'Far (>1%)'
-
-    result['zone'] = zone_type
-    result['zone_dist_pct'] = round(min_dist_pct * 100, 3)
-    result['zone_proximity_band'] = prox_band
-    if nearest is not None:
-        result['zone_strength'] = nearest.get('strength', None)
-        result['nearest_zone_type'] = nearest['zone_type']
-        result['nearest_zone_top'] = nearest['zone_top']
-        result['nearest_zone_bottom'] = nearest['zone_bottom']
-
-    return result
+                d = min(abs(p - top[j]), abs(p - bot[j])) / p
+            if d < best:
+                best = d; nearest[i] = j
+            if d <= proximity_pct:
+                if is_supply[j]: near_s[i] = True
+                else: near_d[i] = True
+        if nearest[i] >= 0:
+            min_dist[i] = best
+    return nearest, min_dist, near_s, near_d
+
+def classify_zones_batch(dts, prices, zones, lookback_hours=720, proximity_pct=0.003):
+    """Classify zone context for all setups at once.
+    `zones` is the output of prepare_zone_arrays (sorted by datetime).
+    Returns a dict of column name -> array aligned with dts/prices."""
+    zt = zones['datetime']
+    lo = np.searchsorted(zt, dts - np.timedelta64(lookback_hours, 'h'), side='left')
+    hi = np.searchsorted(zt, dts, side='left')
+    nearest, d, near_s, near_d = _nearest_zones(lo, hi, prices, zones['top'], zones['bottom'],
+                                                zones['type'] == 'supply', proximity_pct)
+    has = nearest >= 0
+    k = np.where(has, nearest, 0)
+
+    def pick(arr, missing):
+        if not len(arr):
+            return np.full(len(dts), missing, dtype=object if missing is None else float)
+        return np.where(has, arr[k], missing)
+
+    zone = np.select([near_s & near_d, near_s, near_d], ['contested', 'supply', 'demand'], 'neutral')
+    with np.errstate(invalid='ignore'):
+        band = np.select([~has, d == 0, d <= 0.001, d <= 0.003, d <= 0.006, d <= 0.01],
+                         PROXIMITY_BANDS[-1:] + PROXIMITY_BANDS[:5], PROXIMITY_BANDS[5])
+    return {
+        'zone': zone,
+        'zone_dist_pct': np.round(d * 100, 3),
+        'zone_strength': pick(zones['strength'], np.nan),
+        'nearest_zone_type': pick(zones['type'], None),
+        'nearest_zone_top': pick(zones['top'], np.nan),
+        'nearest_zone_bottom': pick(zones['bottom'], np.nan),
+        'zone_proximity_band': band,
+    }
 
 
 # ─────────────────────────────────────────────────────────────
 # SESSION / NEWS
 # ─────────────────────────────────────────────────────────────
-def classify_session(dt):
-    h = dt.hour
-    if 0<=h<8: return 'Asian'
-    elif 8<=h<13: return 'London'
-    elif 13<=h<21: return 'New York'
-    else: return 'Off-Hours'
+SESSION_STARTS = np.array([0, 8, 13, 21])  # UTC hour each session begins
+SESSION_LABELS = np.array(['Asian', 'London', 'New York', 'Off-Hours'], dtype=object)
+
+def classify_session(dts):
+    """Trading session (UTC hour buckets) for a Series of datetimes."""
+    return SESSION_LABELS[np.searchsorted(SESSION_STARTS, dts.dt.hour.to_numpy(), side='right') - 1]
 
-def classify_news(dt, event_dates, daily_vol):
-    d = dt.date() if hasattr(dt,'date') else dt
-    if d in event_dates: return 'Major Event'
-    if daily_vol is not None and d in daily_vol.index:
-        if daily_vol.loc[d] > daily_vol.quantile(0.85): return 'High Volatility'
-    return 'Normal'
+def high_vol_dates(df_1h, q=0.85):
+    """Dates (datetime64[D]) whose daily High-Low range is above the q-quantile of all daily ranges."""
+    daily = df_1h.resample('D')
+    dv = (daily['High'].max() - daily['Low'].min()).dropna()
+    return dv.index[dv > dv.quantile(q)].to_numpy('datetime64[D]')
+
+def classify_news(days, event_dates, high_vol):
+    """'Major Event' on scheduled event dates, 'High Volatility' on high_vol dates, else 'Normal'.
+    All three are datetime64[D] arrays."""
+    is_event = np.isin(days, event_dates)
+    is_high_vol = np.isin(days, high_vol)
+    return np.where(is_event, 'Major Event', np.where(is_high_vol, 'High Volatility', 'Normal'))
 
 
 # ─────────────────────────────────────────────────────────────
 # NARRATIVE GENERATOR
 # ─────────────────────────────────────────────────────────────
-def generate_narrative(s):
-    c1c = "green (bullish)" if s['c1_bullish'] else "red (bearish)"
-    c2c = "green (bullish)" if s['c2_bullish'] else "red (bearish)"
-    c3c = "green (bullish)" if s['c3_bullish'] else "red (bearish)"
-    c1_atr_x = s['c1_body'] / s['c1_atr'] if s['c1_atr'] > 0 else 0
-
-    n = f"**Setup on {s['datetime'].strftime('%A, %B %d, %Y at %H:%M UTC')}**\n\n"
-
-    n += f"**Candle 1 (Big Candle)** was **{c1c}** with body covering **{s['c1_body_pct']:.1f}%** of range "
-    n += f"(O: ${s['c1_open']:.2f}, C: ${s['c1_close']:.2f}, H: ${s['c1_high']:.2f}, L: ${s['c1_low']:.2f}). "
-    n += f"Body was **{c1_atr_x:.1f}x ATR**. "
-    n += f"Wick profile: **\"{s['c1_wick_label']}\"** — "
-
-    if s['c1_upper_wick_pct'] > s['c1_lower_wick_pct'] + 10:
-        n += f"{s['c1_upper_wick_pct']:.0f}% upper vs {s['c1_lower_wick_pct']:.0f}% lower wick — selling pressure near highs. "
-    elif s['c1_lower_wick_pct'] > s['c1_upper_wick_pct'] + 10:
-        n += f"{s['c1_lower_wick_pct']:.0f}% lower vs {s['c1_upper_wick_pct']:.0f}% upper wick — buying pressure from below. "
+@functools.lru_cache(maxsize=2048)
+def _narrative_template(key):
+    """Format-string narrative for one combination of branch outcomes (see generate_narrative)."""
+    (c1_bull, c2_bull, c3_bull, c1_wick_side, c2_wick_side, direction, aligned, zone,
+     has_dist, has_ntype, has_ntop, has_strength, followed, win, target) = key
+    c1c = "green (bullish)" if c1_bull else "red (bearish)"
+    c2c = "green (bullish)" if c2_bull else "red (bearish)"
+    c3c = "green (bullish)" if c3_bull else "red (bearish)"
+
+    n = "**Setup on {when}**\n\n"
+
+    n += f"**Candle 1 (Big Candle)** was **{c1c}** with body covering **{{c1_body_pct:.1f}}%** of range "
+    n += "(O: ${c1_open:.2f}, C: ${c1_close:.2f}, H: ${c1_high:.2f}, L: ${c1_low:.2f}). "
+    n += "Body was **{c1_atr_x:.1f}x ATR**. "
+    n += "Wick profile: **\"{c1_wick_label}\"** — "
+
+    if c1_wick_side == 'upper':
+        n += "{c1_upper_wick_pct:.0f}% upper vs {c1_lower_wick_pct:.0f}% lower wick — selling pressure near highs. "
+    elif c1_wick_side == 'lower':
+        n += "{c1_lower_wick_pct:.0f}% lower vs {c1_upper_wick_pct:.0f}% upper wick — buying pressure from below. "
     else:
-        n += f"balanced wicks ({s['c1_upper_wick_pct']:.0f}% upper, {s['c1_lower_wick_pct']:.0f}% lower) — clean directional move. "
+        n += "balanced wicks ({c1_upper_wick_pct:.0f}% upper, {c1_lower_wick_pct:.0f}% lower) — clean directional move. "
 
     n += f"\n\n**Candle 2 (Inside Bar)** was **{c2c}**, fully contained within C1 "
-    n += f"(H: ${s['c2_high']:.2f} <= ${s['c1_high']:.2f}, L: ${s['c2_low']:.2f} >= ${s['c1_low']:.2f}). "
-    n += f"Wick profile: **\"{s['c2_wick_label']}\"** ({s['c2_upper_wick_pct']:.0f}% upper, {s['c2_lower_wick_pct']:.0f}% lower, {s['c2_body_pct']:.0f}% body). "
+    n += "(H: ${c2_high:.2f} <= ${c1_high:.2f}, L: ${c2_low:.2f} >= ${c1_low:.2f}). "
+    n += "Wick profile: **\"{c2_wick_label}\"** ({c2_upper_wick_pct:.0f}% upper, {c2_lower_wick_pct:.0f}% lower, {c2_body_pct:.0f}% body). "
 
-    if s['c1_bullish'] and not s['c2_bullish']:
-        if 'Lower' in s['c2_wick_label']:
+    if c1_bull and not c2_bull:
+        if c2_wick_side == 'Lower':
             n += "Red C2 with lower wick after green C1 = sellers tried but found support — likely bullish continuation. "
-        elif 'Upper' in s['c2_wick_label']:
+        elif c2_wick_side == 'Upper':
             n += "Red C2 with upper wick after green C1 = fade from highs, sellers present — potential reversal signal. "
         else:
             n += "Red C2 after green C1 signals some profit-taking during consolidation. "
-    elif not s['c1_bullish'] and s['c2_bullish']:
-        if 'Upper' in s['c2_wick_label']:
+    elif not c1_bull and c2_bull:
+        if c2_wick_side == 'Upper':
             n += "Green C2 with upper wick after red C1 = buyers tried but met resistance — likely bearish continuation. "
-        elif 'Lower' in s['c2_wick_label']:
+        elif c2_wick_side == 'Lower':
             n += "Green C2 with lower wick after red C1 = buying pressure building from below — potential reversal. "
         else:
             n += "Green C2 after red C1 signals some relief buying during consolidation. "
-    elif s['c1_bullish'] and s['c2_bullish']:
+    elif c1_bull and c2_bull:
         n += "Both candles bullish — consolidation confirms upward bias. "
     else:
         n += "Both candles bearish — consolidation confirms downward bias. "
 
-    n += f"\n\n**Candle 3 (Breakout)** closed at **${s['c3_close']:.2f}**, which is "
-    if s['direction'] == 'LONG':
-        n += f"**above C2's high** of ${s['c2_high']:.2f} by ${s['c3_breakout_margin']:.2f} "
-        n += f"({s['c3_breakout_margin_pct']:.2f}%, {s['c3_breakout_margin_r']:.2f}R). "
+    n += "\n\n**Candle 3 (Breakout)** closed at **${c3_close:.2f}**, which is "
+    if direction == 'LONG':
+        n += "**above C2's high** of ${c2_high:.2f} by ${c3_breakout_margin:.2f} "
     else:
-        n += f"**below C2's low** of ${s['c2_low']:.2f} by ${s['c3_breakout_margin']:.2f} "
-        n += f"({s['c3_breakout_margin_pct']:.2f}%, {s['c3_breakout_margin_r']:.2f}R). "
-    n += f"Candle was **{c3c}** (O: ${s['c3_open']:.2f} → C: ${s['c3_close']:.2f}), confirming **{s['direction']}** breakout. "
-    if s['c1_direction_match']:
+        n += "**below C2's low** of ${c2_low:.2f} by ${c3_breakout_margin:.2f} "
+    n += "({c3_breakout_margin_pct:.2f}%, {c3_breakout_margin_r:.2f}R). "
+    n += f"Candle was **{c3c}** (O: ${{c3_open:.2f}} → C: ${{c3_close:.2f}}), confirming **{direction}** breakout. "
+    if aligned:
         n += "This **aligns** with C1 — momentum continuation. "
     else:
         n += "This **reverses** C1 — counter-trend breakout. "
 
-    n += f"\n\n**Entry** at C3 close: **${s['entry_price']:.2f}** going **{s['direction']}**, "
-    n += f"SL at ${s['stop_loss']:.2f} ({'C2 low' if s['direction']=='LONG' else 'C2 high'}), "
-    n += f"risk: ${s['risk']:.2f} ({s['risk_pct']:.3f}%). "
+    n += f"\n\n**Entry** at C3 close: **${{entry_price:.2f}}** going **{direction}**, "
+    n += f"SL at ${{stop_loss:.2f}} ({'C2 low' if direction=='LONG' else 'C2 high'}), "
+    n += "risk: ${risk:.2f} ({risk_pct:.3f}%). "
 
     # Zone context with proximity
-    n += f"\n\n**Zone Context:** "
-    if s['zone'] == 'neutral':
+    n += "\n\n**Zone Context:** "
+    if zone == 'neutral':
         n += "No supply/demand zone nearby — **neutral** territory. "
-        if pd.notna(s.get('zone_dist_pct')) and s['zone_dist_pct'] is not None:
-            n += f"Nearest zone is {s['zone_dist_pct']:.2f}% away"
-            if s.get('nearest_zone_type'):
-                n += f" ({s['nearest_zone_type']} zone"
-                if pd.notna(s.get('nearest_zone_top')):
-                    n += f" at ${s['nearest_zone_top']:.2f}-${s['nearest_zone_bottom']:.2f}"
+        if has_dist:
+            n += "Nearest zone is {zone_dist_pct:.2f}% away"
+            if has_ntype:
+                n += " ({nearest_zone_type} zone"
+                if has_ntop:
+                    n += " at ${nearest_zone_top:.2f}-${nearest_zone_bottom:.2f}"
                 n += ")"
             n += ". "
-    elif s['zone'] == 'supply':
-        n += f"At a **SUPPLY zone** (heavy prior selling). "
-        if pd.notna(s.get('zone_dist_pct')):
-            n += f"Dist: **{s['zone_dist_pct']:.2f}%** ({s.get('zone_proximity_band','')})."
-        if pd.notna(s.get('zone_strength')):
-            n += f" Strength: **{s['zone_strength']:.1f}×** ATR. "
-        if pd.notna(s.get('nearest_zone_top')):
-            n += f"Zone: ${s['nearest_zone_bottom']:.2f}-${s['nearest_zone_top']:.2f}. "
-        n += f"{'**With-zone** (SHORT at supply).' if s['direction']=='SHORT' else '**Against-zone** (LONG at supply).'} "
-    elif s['zone'] == 'demand':
-        n += f"At a **DEMAND zone** (heavy prior buying). "
-        if pd.notna(s.get('zone_dist_pct')):
-            n += f"Dist: **{s['zone_dist_pct']:.2f}%** ({s.get('zone_proximity_band','')})."
-        if pd.notna(s.get('zone_strength')):
-            n += f" Strength: **{s['zone_strength']:.1f}×** ATR. "
-        if pd.notna(s.get('nearest_zone_top')):
-            n += f"Zone: ${s['nearest_zone_bottom']:.2f}-${s['nearest_zone_top']:.2f}. "
-        n += f"{'**With-zone** (LONG at demand).' if s['direction']=='LONG' else '**Against-zone** (SHORT at demand).'} "
-    elif s['zone'] == 'contested':
+    elif zone in ('supply', 'demand'):
+        n += ("At a **SUPPLY zone** (heavy prior selling). " if zone == 'supply'
+              else "At a **DEMAND zone** (heavy prior buying). ")
+        if has_dist:
+            n += "Dist: **{zone_dist_pct:.2f}%** ({zone_proximity_band})."
+        if has_strength:
+            n += " Strength: **{zone_strength:.1f}×** ATR. "
+        if has_ntop:
+            n += "Zone: ${nearest_zone_bottom:.2f}-${nearest_zone_top:.2f}. "
+        with_zone = 'SHORT' if zone == 'supply' else 'LONG'
+        n += (f"**With-zone** ({direction} at {zone})." if direction == with_zone
+              else f"**Against-zone** ({direction} at {zone}).") + " "
+    elif zone == 'contested':
         n += "Both supply and demand overlap here — **contested**. "
 
-    n += f"\n\nSession: {s['session']}, News: {s['news']}."
+    n += "\n\nSession: {session}, News: {news}."
 
     # C4/C5/C6 follow-through
-    n += f"\n\n**Follow-Through Analysis:**\n"
-    for lbl, cr, fol in [('C4', s.get('c4_close_r'), s.get('c4_followed')),
-                         ('C5', s.get('c5_close_r'), s.get('c5_followed')),
-                         ('C6', s.get('c6_close_r'), s.get('c6_followed'))]:
-        if cr is not None:
+    n += "\n\n**Follow-Through Analysis:**\n"
+    for lbl, fol in zip(('C4', 'C5', 'C6'), followed):
+        if fol is not None:
             emoji = "✅" if fol else "❌"
-            n += f"- **{lbl}**: closed at **{cr:+.2f}R** from entry {emoji} {'(followed)' if fol else '(reversed)'}\n"
-    n += f"- **{s.get('follow_count', 0)}/3 candles** followed the breakout direction\n"
-
-    n += f"\n**Result:** "
-    if s['win_1r']:
-        n += f"**WIN** — 1R target reached. "
-    else:
-        n += f"**LOSS** — stopped out. "
-    n += f"MFE: {s['max_favorable_r']:.2f}R, MAE: {s['max_adverse_r']:.2f}R."
-    if s['hit_2r']: n += " Reached 2R — wider TP would have captured more."
-    elif s['hit_15r']: n += " Reached 1.5R."
-
+            n += f"- **{lbl}**: closed at **{{{lbl.lower()}_close_r:+.2f}}R** from entry {emoji} {'(followed)' if fol else '(reversed)'}\n"
+    n += "- **{follow_count}/3 candles** followed the breakout direction\n"
+
+    n += "\n**Result:** "
+    n += "**WIN** — 1R target reached. " if win else "**LOSS** — stopped out. "
+    n += "MFE: {max_favorable_r:.2f}R, MAE: {max_adverse_r:.2f}R."
+    if target == '2R': n += " Reached 2R — wider TP would have captured more."
+    elif target == '1.5R': n += " Reached 1.5R."
     return n
 
+def generate_narrative(s):
+    """Candle-by-candle markdown narrative for one enriched setup row."""
+    up, lo = s['c1_upper_wick_pct'], s['c1_lower_wick_pct']
+    c2_wl = s['c2_wick_label']
+    key = (bool(s['c1_bullish']), bool(s['c2_bullish']), bool(s['c3_bullish']),
+           'upper' if up > lo + 10 else ('lower' if lo > up + 10 else 'balanced'),
+           'Lower' if 'Lower' in c2_wl else ('Upper' if 'Upper' in c2_wl else ''),
+           s['direction'], bool(s['c1_direction_match']), s['zone'],
+           bool(pd.notna(s.get('zone_dist_pct')) and s['zone_dist_pct'] is not None),
+           bool(pd.notna(s.get('nearest_zone_type'))), bool(pd.notna(s.get('nearest_zone_top'))),
+           bool(pd.notna(s.get('zone_strength'))),
+           tuple(None if s.get(f'c{k}_close_r') is None else bool(s.get(f'c{k}_followed')) for k in (4, 5, 6)),
+           bool(s['win_1r']), '2R' if s['hit_2r'] else ('1.5R' if s['hit_15r'] else None))
+    fields = dict(s)
+    fields['when'] = s['datetime'].strftime('%A, %B %d, %Y at %H:%M UTC')
+    fields['c1_atr_x'] = s['c1_body'] / s['c1_atr'] if s['c1_atr'] > 0 else 0
+    fields.setdefault('zone_proximity_band', '')
+    fields.setdefault('follow_count', 0)
+    return _narrative_template(key).format(**fields)
+
 
 # ─────────────────────────────────────────────────────────────
 # PATTERN DETECTION
 # ─────────────────────────────────────────────────────────────
+FIRST_HIT_LABELS = np.array([None, 'SL', '1R'], dtype=object)
+
+def candle_outcomes(k, entry, risk, is_long, H, L, C):
+    """Close/favorable/adverse excursion (R) of candles k and whether each followed the trade."""
+    close_r = np.where(is_long, C[k]-entry, entry-C[k]) / risk
+    high_r = np.where(is_long, H[k]-entry, entry-L[k]) / risk
+    low_r = np.where(is_long, entry-L[k], H[k]-entry) / risk
+    return (np.round(close_r, 3), np.round(np.maximum(0, high_r), 3),
+            np.round(np.maximum(0, low_r), 3), np.where(is_long, C[k] > entry, C[k] < entry))
+
+@njit(cache=True)
+def _scan_outcomes(start, end, entry, sl, risk, is_long, H, L):
+    """Forward scan candles [start, end) for MFE/MAE and 1R/1.5R/2R/SL hits.
+    first_hit: 0 = none, 1 = SL, 2 = 1R (index into FIRST_HIT_LABELS)."""
+    hit_1r = hit_15r = hit_2r = hit_sl = False
+    first_hit = 0; mfe = 0.0; mae = 0.0
+    for j in range(start, end):
+        if is_long:
+            fav = (H[j]-entry)/risk
+            adv = (entry-L[j])/risk
+        else:
+            fav = (entry-L[j])/risk
+            adv = (H[j]-entry)/risk
+        mfe = max(mfe, fav); mae = max(mae, adv)
+        if is_long:
+            if L[j] <= sl and not hit_sl:
+                hit_sl = True
+                if first_hit == 0: first_hit = 1
+            if H[j] >= entry+risk and not hit_1r:
+                hit_1r = True
+                if first_hit == 0: first_hit = 2
+            if H[j] >= entry+1.5*risk: hit_15r = True
+            if H[j] >= entry+2*risk: hit_2r = True
+        else:
+            if H[j] >= sl and not hit_sl:
+                hit_sl = True
+                if first_hit == 0: first_hit = 1
+            if L[j] <= entry-risk and not hit_1r:
+                hit_1r = True
+                if first_hit == 0: first_hit = 2
+            if L[j] <= entry-1.5*risk: hit_15r = True
+            if L[j] <= entry-2*risk: hit_2r = True
+    return hit_1r, hit_15r, hit_2r, hit_sl, first_hit, mfe, mae
+
+@njit(cache=True)
+def _scan_outcomes_batch(cand, entry, sl, risk, is_long, H, L, horizon=20):
+    """Run _scan_outcomes for every setup (C4 onwards), filling preallocated output arrays."""
+    m = len(cand); n = len(H)
+    hits = np.zeros((m, 4), dtype=np.bool_)
+    first = np.zeros(m, dtype=np.int64)
+    mfe = np.zeros(m); mae = np.zeros(m)
+    for s in range(m):
+        h1, h15, h2, hsl, fh, fav, adv = _scan_outcomes(
+            cand[s]+3, min(cand[s]+3+horizon, n), entry[s], sl[s], risk[s], is_long[s], H, L)
+        hits[s, 0] = h1; hits[s, 1] = h15; hits[s, 2] = h2; hits[s, 3] = hsl
+        first[s] = fh; mfe[s] = fav; mae[s] = adv
+    return hits, first, mfe, mae
+
+
+@cache_derived
 def detect_setups(df, body_ratio_thresh=0.65, atr_mult=1.3):
     """
     Detect the Inside Bar Breakout setup:
@@ -406,168 +619,81 @@ def detect_setups(df, body_ratio_thresh=0.65, atr_mult=1.3):
     Track: C4, C5, C6 candle-by-candle follow-through
     """
     if len(df) < 20: return pd.DataFrame()
-    df = df.copy()
-    df['Body'] = abs(df['Close'] - df['Open'])
-    df['Range'] = df['High'] - df['Low']
-    df['BodyRatio'] = df['Body'] / df['Range'].replace(0, np.nan)
-    df['IsBullish'] = df['Close'] > df['Open']
-    df['TR'] = np.maximum(df['High']-df['Low'], np.maximum(abs(df['High']-df['Close'].shift(1)), abs(df['Low']-df['Close'].shift(1))))
-    df['ATR'] = df['TR'].rolling(14).mean()
-    setups = []
-    indices = df.index.tolist()
-
-    for i in range(14, len(df) - 6):  # need at least C1..C6
-        c1, c2, c3 = df.iloc[i], df.iloc[i+1], df.iloc[i+2]
-        c4 = df.iloc[i+3]
-        c5 = df.iloc[i+4] if i+4 < len(df) else None
-        c6 = df.iloc[i+5] if i+5 < len(df) else None
-
-        if pd.isna(c1['ATR']) or c1['ATR']==0: continue
-        # C1: Big candle
-        if c1['BodyRatio'] < body_ratio_thresh: continue
-        if c1['Body'] < c1['ATR'] * atr_mult: continue
-        # C2: Inside bar
-        if not (c2['High'] <= c1['High'] and c2['Low'] >= c1['Low']): continue
-
-        # C3: Breakout — must CLOSE beyond C2's range
-        if c3['Close'] > c2['High']:
-            direction = 'LONG'
-        elif c3['Close'] < c2['Low']:
-            direction = 'SHORT'
-        else:
-            continue  # C3 didn't close beyond C2 range — no valid breakout
-
-        c3_bull = c3['Close'] > c3['Open']
-
-        # Entry at C3 close
-        entry = c3['Close']
-        sl = c2['Low'] if direction=='LONG' else c2['High']
-        risk = entry - sl if direction=='LONG' else sl - entry
-        if risk <= 0: continue
-
-        # ── Wick profiles ──
-        c1_wl, c1_up, c1_lp, c1_bp, c1_bull = classify_wick_profile(c1['Open'],c1['Close'],c1['High'],c1['Low'])
-        c2_wl, c2_up, c2_lp, c2_bp, c2_bull = classify_wick_profile(c2['Open'],c2['Close'],c2['High'],c2['Low'])
-
-        # ── Track C4, C5, C6 individually ──
-        def candle_result(candle, entry_px, risk_px, d):
-            if candle is None:
-                return {'close_r': None, 'high_r': None, 'low_r': None, 'followed': None}
-            if d == 'LONG':
-                close_r = (candle['Close'] - entry_px) / risk_px
-                high_r = (candle['High'] - entry_px) / risk_px
-                low_r = (entry_px - candle['Low']) / risk_px  # adverse
-                followed = candle['Close'] > entry_px
-            else:
-                close_r = (entry_px - candle['Close']) / risk_px
-                high_r = (entry_px - candle['Low']) / risk_px  # favorable for short
-                low_r = (candle['High'] - entry_px) / risk_px  # adverse for short
-                followed = candle['Close'] < entry_px
-            return {'close_r': round(close_r, 3), 'mfe_r': round(max(0, high_r), 3),
-                    'mae_r': round(max(0, low_r), 3), 'followed': followed}
-
-        c4_res = candle_result(c4, entry, risk, direction)
-        c5_res = candle_result(c5, entry, risk, direction)
-        c6_res = candle_result(c6, entry, risk, direction)
-
-        # ── Track target hits over C4-C6 and beyond (up to 20 candles) ──
-        hit_1r=hit_15r=hit_2r=hit_sl=False
-        first_hit=None; mfe=0; mae=0
-
-        for j in range(i+3, min(i+23, len(df))):
-            c = df.iloc[j]
-            if direction=='LONG':
-                fav = (c['High']-entry)/risk
-                adv = (entry-c['Low'])/risk
-            else:
-                fav = (entry-c['Low'])/risk
-                adv = (c['High']-entry)/risk
-            mfe=max(mfe,fav); mae=max(mae,adv)
-            if direction=='LONG':
-                if c['Low']<=sl and not hit_sl:
-                    hit_sl=True
-                    if first_hit is None: first_hit='SL'
-                if c['High']>=entry+risk and not hit_1r:
-                    hit_1r=True
-                    if first_hit is None: first_hit='1R'
-                if c['High']>=entry+1.5*risk: hit_15r=True
-                if c['High']>=entry+2*risk: hit_2r=True
-            else:
-                if c['High']>=sl and not hit_sl:
-                    hit_sl=True
-                    if first_hit is None: first_hit='SL'
-                if c['Low']<=entry-risk and not hit_1r:
-                    hit_1r=True
-                    if first_hit is None: first_hit='1R'
-                if c['Low']<=entry-1.5*risk: hit_15r=True
-                if c['Low']<=entry-2*risk: hit_2r=True
-
-        win = hit_1r if first_hit=='1R' else (False if first_hit=='SL' else (c4_res['close_r'] is not None and c4_res['close_r']>0))
-
-        # C3 breakout margin — how far beyond C2 range did C3 close?
-        if direction == 'LONG':
-            breakout_margin = c3['Close'] - c2['High']
-        else:
-            breakout_margin = c2['Low'] - c3['Close']
-        breakout_margin_pct = (breakout_margin / entry) * 100
-        breakout_margin_r = breakout_margin / risk if risk > 0 else 0
-
-        # How many of C4/C5/C6 followed the direction?
-        follow_count = sum(1 for r in [c4_res, c5_res, c6_res] if r['followed'] is True)
-
-        c1wb = wick_bucket(c1_wl)
-        c2wb = wick_bucket(c2_wl)
-
-        setups.append({
-            'datetime': indices[i],
-            'c1_open':c1['Open'],'c1_close':c1['Close'],'c1_high':c1['High'],'c1_low':c1['Low'],
-            'c1_body':c1['Body'],'c1_range':c1['Range'],'c1_body_ratio':c1['BodyRatio'],
-            'c1_bullish':c1_bull,'c1_atr':c1['ATR'],
-            'c1_wick_label':c1_wl,'c1_upper_wick_pct':c1_up,'c1_lower_wick_pct':c1_lp,'c1_body_pct':c1_bp,
-            'c1_wick_bucket': c1wb,
-            'c2_open':c2['Open'],'c2_close':c2['Close'],'c2_high':c2['High'],'c2_low':c2['Low'],
-            'c2_bullish':c2_bull,
-            'c2_wick_label':c2_wl,'c2_upper_wick_pct':c2_up,'c2_lower_wick_pct':c2_lp,'c2_body_pct':c2_bp,
-            'c2_wick_bucket': c2wb,
-            'c3_open':c3['Open'],'c3_close':c3['Close'],'c3_high':c3['High'],'c3_low':c3['Low'],
-            'c3_bullish':c3_bull,
-            'c3_breakout_margin': round(breakout_margin, 2),
-            'c3_breakout_margin_pct': round(breakout_margin_pct, 3),
-            'c3_breakout_margin_r': round(breakout_margin_r, 3),
-            'direction': direction, 'entry_price':entry, 'stop_loss':sl,
-            'risk':risk, 'risk_pct':(risk/entry)*100,
-            # C4 candle-by-candle
-            'c4_close_r': c4_res['close_r'], 'c4_mfe_r': c4_res['mfe_r'],
-            'c4_mae_r': c4_res['mae_r'], 'c4_followed': c4_res['followed'],
-            'c4_open': c4['Open'], 'c4_close': c4['Close'], 'c4_high': c4['High'], 'c4_low': c4['Low'],
-            # C5
-            'c5_close_r': c5_res['close_r'], 'c5_mfe_r': c5_res['mfe_r'],
-            'c5_mae_r': c5_res['mae_r'], 'c5_followed': c5_res['followed'],
-            'c5_open': c5['Open'] if c5 is not None else None,
-            'c5_close': c5['Close'] if c5 is not None else None,
-            'c5_high': c5['High'] if c5 is not None else None,
-            'c5_low': c5['Low'] if c5 is not None else None,
-            # C6
-            'c6_close_r': c6_res['close_r'], 'c6_mfe_r': c6_res['mfe_r'],
-            'c6_mae_r': c6_res['mae_r'], 'c6_followed': c6_res['followed'],
-            'c6_open': c6['Open'] if c6 is not None else None,
-            'c6_close': c6['Close'] if c6 is not None else None,
-            'c6_high': c6['High'] if c6 is not None else None,
-            'c6_low': c6['Low'] if c6 is not None else None,
-            # Follow-through
-            'follow_count': follow_count,
-            # Overall outcomes
-            'hit_1r':hit_1r,'hit_15r':hit_15r,'hit_2r':hit_2r,'hit_sl':hit_sl,
-            'first_hit':first_hit,'win_1r':win,
-            'max_favorable_r':mfe,'max_adverse_r':mae,
-            'c1_direction_match': c1_bull == (direction=='LONG'),
-            'c1_color': 'Green' if c1_bull else 'Red',
-            'c2_color': 'Green' if c2_bull else 'Red',
-            'scenario_key': get_scenario_key(c1_bull, c1wb, c2_bull, c2wb),
-        })
-    return pd.DataFrame(setups)
-
-
+    O, H, L, C, Body, Range, BR, ATR = candle_features(df)
+    n = len(df)
+
+    # Vectorized C1/C2/C3 filters
+    idx = np.arange(atr_start(ATR), n - 6)  # need at least C1..C6
+    c1_ok = (ATR[idx] > 0) & ~(BR[idx] < body_ratio_thresh) & ~(Body[idx] < ATR[idx] * atr_mult)
+    inside = (H[idx+1] <= H[idx]) & (L[idx+1] >= L[idx])
+    breakout = (C[idx+2] > H[idx+1]) | (C[idx+2] < L[idx+1])
+    cand = idx[c1_ok & inside & breakout]
+
+    # C3: Breakout — entry at C3 close, stop at the opposite end of C2
+    is_long = C[cand+2] > H[cand+1]
+    entry = C[cand+2]
+    sl = np.where(is_long, L[cand+1], H[cand+1])
+    risk = np.where(is_long, entry - sl, sl - entry)
+    keep = risk > 0
+    cand, is_long, entry, sl, risk = cand[keep], is_long[keep], entry[keep], sl[keep], risk[keep]
+    if not len(cand): return pd.DataFrame()
+    direction = np.where(is_long, 'LONG', 'SHORT').astype(object)
+
+    # ── Wick profiles ──
+    wick, w_up, w_lp, w_bp, w_bull = classify_wick_profiles(O, H, L, C)
+    c1_bull, c2_bull = w_bull[cand], w_bull[cand+1]
+    c1wb, c2wb = WICK_BUCKETS[wick[cand]], WICK_BUCKETS[wick[cand+1]]
+
+    # ── Track C4, C5, C6 individually ──
+    c4 = candle_outcomes(cand+3, entry, risk, is_long, H, L, C)
+    c5 = candle_outcomes(cand+4, entry, risk, is_long, H, L, C)
+    c6 = candle_outcomes(cand+5, entry, risk, is_long, H, L, C)
+
+    # ── Track target hits over C4-C6 and beyond (up to 20 candles) ──
+    hits, first_code, mfe, mae = _scan_outcomes_batch(cand, entry, sl, risk, is_long, H, L)
+    win = np.select([first_code == 2, first_code == 1], [hits[:, 0], False], c4[0] > 0)
+
+    # C3 breakout margin — how far beyond C2 range did C3 close?
+    breakout_margin = np.where(is_long, C[cand+2] - H[cand+1], L[cand+1] - C[cand+2])
+
+    out = {'datetime': df.index[cand],
+           'c1_open': O[cand], 'c1_close': C[cand], 'c1_high': H[cand], 'c1_low': L[cand],
+           'c1_body': Body[cand], 'c1_range': Range[cand], 'c1_body_ratio': BR[cand],
+           'c1_bullish': c1_bull, 'c1_atr': ATR[cand],
+           'c1_wick_label': WICK_LABELS[wick[cand]], 'c1_upper_wick_pct': w_up[cand],
+           'c1_lower_wick_pct': w_lp[cand], 'c1_body_pct': w_bp[cand], 'c1_wick_bucket': c1wb,
+           'c2_open': O[cand+1], 'c2_close': C[cand+1], 'c2_high': H[cand+1], 'c2_low': L[cand+1],
+           'c2_bullish': c2_bull,
+           'c2_wick_label': WICK_LABELS[wick[cand+1]], 'c2_upper_wick_pct': w_up[cand+1],
+           'c2_lower_wick_pct': w_lp[cand+1], 'c2_body_pct': w_bp[cand+1], 'c2_wick_bucket': c2wb,
+           'c3_open': O[cand+2], 'c3_close': C[cand+2], 'c3_high': H[cand+2], 'c3_low': L[cand+2],
+           'c3_bullish': C[cand+2] > O[cand+2],
+           'c3_breakout_margin': np.round(breakout_margin, 2),
+           'c3_breakout_margin_pct': np.round(breakout_margin / entry * 100, 3),
+           'c3_breakout_margin_r': np.round(breakout_margin / risk, 3),
+           'direction': direction, 'entry_price': entry, 'stop_loss': sl,
+           'risk': risk, 'risk_pct': risk / entry * 100}
+    # C4/C5/C6 candle-by-candle
+    for k, res in ((3, c4), (4, c5), (5, c6)):
+        p = f'c{k+1}_'
+        out.update({p+'close_r': res[0], p+'mfe_r': res[1], p+'mae_r': res[2], p+'followed': res[3],
+                    p+'open': O[cand+k], p+'close': C[cand+k], p+'high': H[cand+k], p+'low': L[cand+k]})
+    out.update({
+        # Follow-through: how many of C4/C5/C6 followed the direction?
+        'follow_count': c4[3].astype(int) + c5[3] + c6[3],
+        # Overall outcomes
+        'hit_1r': hits[:, 0], 'hit_15r': hits[:, 1], 'hit_2r': hits[:, 2], 'hit_sl': hits[:, 3],
+        'first_hit': FIRST_HIT_LABELS[first_code], 'win_1r': win,
+        'max_favorable_r': mfe, 'max_adverse_r': mae,
+        'c1_direction_match': c1_bull == is_long,
+        'c1_color': np.where(c1_bull, 'Green', 'Red').astype(object),
+        'c2_color': np.where(c2_bull, 'Green', 'Red').astype(object),
+        'scenario_key': get_scenario_key(c1_bull, c1wb, c2_bull, c2wb),
+    })
+    return pd.DataFrame(out)
+
+
+@cache_derived
 def detect_setups_with_diagnostics(df, body_ratio_thresh=0.65, atr_mult=1.3):
     """Wrapper that returns both setups and a diagnostic funnel."""
     diag = {
@@ -578,82 +704,79 @@ def detect_setups_with_diagnostics(df, body_ratio_thresh=0.65, atr_mult=1.3):
     if len(df) < 20:
         return pd.DataFrame(), diag
 
-    df_c = df.copy()
-    df_c['Body'] = abs(df_c['Close'] - df_c['Open'])
-    df_c['Range'] = df_c['High'] - df_c['Low']
-    df_c['BodyRatio'] = df_c['Body'] / df_c['Range'].replace(0, np.nan)
-    df_c['TR'] = np.maximum(df_c['High']-df_c['Low'],
-                            np.maximum(abs(df_c['High']-df_c['Close'].shift(1)),
-                                       abs(df_c['Low']-df_c['Close'].shift(1))))
-    df_c['ATR'] = df_c['TR'].rolling(14).mean()
-
-    for i in range(14, len(df_c) - 6):
-        c1 = df_c.iloc[i]
-        if pd.isna(c1['ATR']) or c1['ATR'] == 0:
-            continue
-        diag['total_scanned'] += 1
-
-        br_pass = c1['BodyRatio'] >= body_ratio_thresh
-        atr_pass = c1['Body'] >= c1['ATR'] * atr_mult
-        if br_pass:
-            diag['pass_body_ratio'] += 1
-        if atr_pass:
-            diag['pass_body_atr'] += 1
-        if not (br_pass and atr_pass):
-            continue
-        diag['pass_both_c1'] += 1
-
-        c2 = df_c.iloc[i+1]
-        if not (c2['High'] <= c1['High'] and c2['Low'] >= c1['Low']):
-            continue
-        diag['pass_inside_bar'] += 1
-
-        c3 = df_c.iloc[i+2]
-        if c3['Close'] > c2['High']:
-            direction = 'LONG'
-        elif c3['Close'] < c2['Low']:
-            direction = 'SHORT'
-        else:
-            continue
-        diag['pass_c3_breakout'] += 1
-
-        entry = c3['Close']
-        sl = c2['Low'] if direction == 'LONG' else c2['High']
-        risk = entry - sl if direction == 'LONG' else sl - entry
-        if risk > 0:
-            diag['pass_valid_risk'] += 1
+    _, H, L, C, Body, _, BR, ATR = candle_features(df)
+    i = np.arange(atr_start(ATR), len(df) - 6)
+    scanned = ATR[i] > 0
+    br_pass = scanned & (BR[i] >= body_ratio_thresh)
+    atr_pass = scanned & (Body[i] >= ATR[i] * atr_mult)
+    both = br_pass & atr_pass
+    inside = both & (H[i+1] <= H[i]) & (L[i+1] >= L[i])
+    long_ = C[i+2] > H[i+1]
+    breakout = inside & (long_ | (C[i+2] < L[i+1]))
+    risk = np.where(long_, C[i+2] - L[i+1], H[i+1] - C[i+2])
+    for k, mask in (('total_scanned', scanned), ('pass_body_ratio', br_pass), ('pass_body_atr', atr_pass),
+                    ('pass_both_c1', both), ('pass_inside_bar', inside), ('pass_c3_breakout', breakout),
+                    ('pass_valid_risk', breakout & (risk > 0))):
+        diag[k] = int(np.count_nonzero(mask))
 
     setups = detect_setups(df, body_ratio_thresh, atr_mult)
     return setups, diag
 
+FUNNEL_COLS = ['total_scanned', 'pass_body_ratio', 'pass_body_atr', 'pass_both_c1',
+               'pass_inside_bar', 'pass_c3_breakout', 'pass_valid_risk']
+
+def funnel_table(diagnostics, body_ratio, atr_mult):
+    """All diagnostic funnels as one long frame: a row per (key, stage) with count, % of total and drop-off."""
+    stages = [
+        "1. Total candles scanned",
+        f"2. Pass C1 body ratio (≥{body_ratio*100:.0f}%)",
+        f"3. Pass C1 body size (≥{atr_mult}× ATR)",
+        "4. Pass C1 body ratio AND size",
+        "5. C2 is inside bar (H≤C1H, L≥C1L)",
+        "6. C3 closes beyond C2 range",
+        "7. Valid risk (entry - SL > 0)",
+    ]
+    k = len(FUNNEL_COLS)
+    counts = np.array([[d[c] for c in FUNNEL_COLS] for d in diagnostics.values()], dtype=np.int64).reshape(-1, k)
+    drop = pd.Series((-np.diff(counts, axis=1, prepend=0)).ravel()).map('-{:,}'.format).to_numpy(object)
+    drop[::k] = '—'
+    return pd.DataFrame({'key': np.repeat(list(diagnostics), k), 'Stage': np.tile(stages, len(counts)),
+                         'Count': counts.ravel(),
+                         '% of Total': (counts / np.maximum(counts[:, :1], 1) * 100).round(1).ravel(),
+                         'Drop-off': drop})
+
 
 # ─────────────────────────────────────────────────────────────
 # ENRICHMENT
 # ─────────────────────────────────────────────────────────────
+LABEL_COLS = ['c1_color', 'c2_color', 'c1_wick_bucket', 'c2_wick_bucket', 'c1_wick_label',
+              'c2_wick_label', 'zone_dir', 'scenario_key', 'year_month']
+# Labels with a known, closed set of values get fixed categories, so every result shares one dtype.
+# Categories are sorted, matching the order groupby/heatmaps produced for the plain strings.
+LABEL_LEVELS = {
+    'direction': ['LONG', 'SHORT'],
+    'zone': sorted(['contested', 'supply', 'demand', 'neutral']),
+    'nearest_zone_type': ['demand', 'supply'],
+    'zone_proximity_band': sorted(PROXIMITY_BANDS),
+    'session': sorted(SESSION_LABELS),
+    'day_name': sorted(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']),
+    'month_name': sorted(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']),
+}
+
+@cache_derived
 def enrich_setups(sdf, df_1h, zones_df, event_dates, zone_lookback=720, zone_proximity=0.003):
     if sdf.empty: return sdf
     s = sdf.copy()
-    dr = df_1h.resample('D').agg({'High':'max','Low':'min'})
-    dr['DR'] = dr['High']-dr['Low']
-    dv = dr['DR'].dropna(); dv.index = dv.index.date
-
-    # Classify zones with full context
-    zone_info = s.apply(
-        lambda r: classify_zone(r['datetime'], r['entry_price'], zones_df,
-                                lookback_hours=zone_lookback, proximity_pct=zone_proximity/100),
-        axis=1
-    )
-    zone_df = pd.DataFrame(zone_info.tolist(), index=s.index)
-    s['zone'] = zone_df['zone']
-    s['zone_dist_pct'] = zone_df['zone_dist_pct']
-    s['zone_strength'] = zone_df['zone_strength']
-    s['nearest_zone_type'] = zone_df['nearest_zone_type']
-    s['nearest_zone_top'] = zone_df['nearest_zone_top']
-    s['nearest_zone_bottom'] = zone_df['nearest_zone_bottom']
-    s['zone_proximity_band'] = zone_df['zone_proximity_band']
-
-    s['session'] = s['datetime'].apply(classify_session)
-    s['news'] = s['datetime'].apply(lambda dt: classify_news(dt, event_dates, dv))
+
+    # Classify zones with full context — one batched pass over all setups
+    zone_info = classify_zones_batch(s['datetime'].to_numpy('datetime64[ns]'), s['entry_price'].to_numpy(float),
+                                     prepare_zone_arrays(zones_df), lookback_hours=zone_lookback,
+                                     proximity_pct=zone_proximity/100)
+    for col, values in zone_info.items():
+        s[col] = values
+
+    s['session'] = classify_session(s['datetime'])
+    s['news'] = classify_news(s['datetime'].to_numpy('datetime64[D]'), event_dates, high_vol_dates(df_1h))
     s['date'] = s['datetime'].dt.date
     s['month_name'] = s['datetime'].dt.strftime('%b')
     s['year_month'] = s['datetime'].dt.to_period('M').astype(str)
@@ -661,80 +784,242 @@ def enrich_setups(sdf, df_1h, zones_df, event_dates, zone_lookback=720, zone_pro
     s['hour'] = s['datetime'].dt.hour
     s['day_of_week'] = s['datetime'].dt.dayofweek
     s['alignment'] = s['c1_direction_match'].map({True:'Aligned',False:'Counter'})
-    s['pnl_r'] = s['win_1r'].apply(lambda w: 1.0 if w else -1.0)
+    # With-zone = LONG at demand / SHORT at supply; against-zone = the opposite
+    at_demand, at_supply, is_long = s['zone'] == 'demand', s['zone'] == 'supply', s['direction'] == 'LONG'
+    s['zone_dir'] = np.select([(at_demand & is_long) | (at_supply & ~is_long),
+                               (at_demand & ~is_long) | (at_supply & is_long), s['zone'] == 'neutral'],
+                              ['with', 'against', 'neutral'], default='other')
+    for c in ('c1', 'c2'):  # color / wick bucket, rows and columns of the scenario matrix
+        # Pair the two label codes; only the few distinct category names are string-joined
+        color, bucket = pd.Categorical(s[f'{c}_color']), pd.Categorical(s[f'{c}_wick_bucket'])
+        s[f'{c}_profile'] = pd.Categorical.from_codes(
+            color.codes * len(bucket.categories) + bucket.codes,
+            [f'{a} / {b}' for a in color.categories for b in bucket.categories]).remove_unused_categories()
+    s['pnl_r'] = np.where(s['win_1r'], 1.0, -1.0)
     s['cumulative_r'] = s['pnl_r'].cumsum()
-    return s
+    # Low-cardinality labels are grouped/filtered on every render: store them as categories
+    return s.astype({**{c: 'category' for c in LABEL_COLS},
+                     **{c: pd.CategoricalDtype(v) for c, v in LABEL_LEVELS.items()}})
+
+def analyze_timeframe(df, enrich_df, event_dates, body_ratio, atr_mult, zone_lb, zone_prox, zone_strength_min):
+    """Zones + detect + enrich one asset/timeframe. Pure compute (no widgets, no session state),
+    so main() can run several of these on worker threads. Returns (zones, setups, diagnostics)."""
+    zones = detect_zones(df, zone_strength_min)
+    setups, diag = detect_setups_with_diagnostics(df, body_ratio, atr_mult)
+    if not setups.empty:
+        setups = enrich_setups(setups, enrich_df, zones, event_dates,
+                               zone_lookback=zone_lb, zone_proximity=zone_prox)
+    return zones, setups, diag
 
 
 # ─────────────────────────────────────────────────────────────
 # STATS
 # ─────────────────────────────────────────────────────────────
+STAT_COLS = ['win_1r', 'hit_1r', 'hit_15r', 'hit_2r', 'max_favorable_r', 'max_adverse_r']
+
 def calc_stats(df_sub, label=""):
     n = len(df_sub)
     if n==0:
         return {'Label':label,'Trades':0,'Win Rate':0,'Avg R':0,'PF':0,'Hit 1R%':0,'Hit 1.5R%':0,'Hit 2R%':0,'Avg MFE':0,'Avg MAE':0}
-    wins = df_sub['win_1r'].sum()
-    tw = df_sub[df_sub['pnl_r']>0]['pnl_r'].sum()
-    tl = abs(df_sub[df_sub['pnl_r']<0]['pnl_r'].sum())
-    return {'Label':label,'Trades':n,'Win Rate':round(wins/n*100,1),'Avg R':round(df_sub['pnl_r'].mean(),3),
+    pnl = df_sub['pnl_r'].to_numpy(float)
+    tw = pnl.clip(min=0).sum(); tl = -pnl.clip(max=0).sum()
+    wr, h1, h15, h2, mfe, mae = df_sub[STAT_COLS].to_numpy(float).mean(axis=0)
+    return {'Label':label,'Trades':n,'Win Rate':round(wr*100,1),'Avg R':round(pnl.mean(),3),
         'PF':round(tw/tl,2) if tl>0 else 999,
-        'Hit 1R%':round(df_sub['hit_1r'].mean()*100,1),'Hit 1.5R%':round(df_sub['hit_15r'].mean()*100,1),
-        'Hit 2R%':round(df_sub['hit_2r'].mean()*100,1),
-        'Avg MFE':round(df_sub['max_favorable_r'].mean(),2),'Avg MAE':round(df_sub['max_adverse_r'].mean(),2)}
+        'Hit 1R%':round(h1*100,1),'Hit 1.5R%':round(h15*100,1),'Hit 2R%':round(h2*100,1),
+        'Avg MFE':round(mfe,2),'Avg MAE':round(mae,2)}
+
+@functools.lru_cache(maxsize=256)
+def win_rate_significance(wins, n):
+    """Binomial test of wins/n against a 50% win rate: (p-value, 95% CI low, 95% CI high).
+    Depends on two integers only, so repeated renders hit the cache."""
+    bt = binomtest(wins, n, 0.5); ci = bt.proportion_ci(confidence_level=0.95)
+    return bt.pvalue, ci.low, ci.high
+
+def stat_frame(setups, **keys):
+    """Just the columns calc_stats/seg_analysis read, plus derived segment keys (no full-frame copy)."""
+    return setups[['pnl_r', *STAT_COLS]].assign(**keys)
 
 def seg_analysis(setups, col, col_name):
-    rows = [calc_stats(setups[setups[col]==v], str(v)) for v in sorted(setups[col].unique())]
-    return pd.DataFrame(rows).rename(columns={'Label':col_name})
+    """calc_stats for every value of `col` (sorted), computed with one groupby."""
+    if setups.empty: return pd.DataFrame()
+    # Group only the columns the stats need instead of the full ~100-column setups frame
+    return _seg_table(setups[[col, 'pnl_r', *STAT_COLS]], col, col_name)
+
+# Results live in st.session_state until the next Run, so whatever is derived from one and stored
+# on its dict survives widget reruns (filters, sorting, section switches) without recomputation
+# or re-hashing the setups. Memoized values are shared: callers must not mutate them.
+def memo(result, key, fn, *args, **kw):
+    """fn(*args, **kw), computed once per result for `key`."""
+    cache = result.setdefault('memo', {})
+    if key not in cache:
+        cache[key] = fn(*args, **kw)
+    return cache[key]
+
+def result_seg(result, col, col_name):
+    """seg_analysis of the result's setups."""
+    return memo(result, ('seg', col, col_name), seg_analysis, result['setups'], col, col_name)
+
+def result_rows(result, col):
+    """{value: row positions} of the result's setups for `col`."""
+    return memo(result, ('rows', col), lambda: result['setups'].groupby(col, observed=True).indices)
+
+def result_options(result, col):
+    """['All'] + the observed values of `col`, sorted: the setup-log filter choices."""
+    setups = result['setups']
+    return memo(result, ('options', col),
+                lambda: ['All'] + (list(result_rows(result, col)) if col in setups.columns else []))
+
+def result_fig(result, name, build, *args, **kw):
+    """Figure build(*args, **kw) of the result, stored under `name`."""
+    return memo(result, ('fig', name), build, *args, **kw)
+
+@cache_tables
+def _seg_table(sub, col, col_name):
+    pnl = sub['pnl_r']
+    g = sub.assign(_tw=pnl.clip(lower=0), _tl=-pnl.clip(upper=0)).groupby(col, observed=True)
+    a = g.agg(n=('win_1r', 'size'), wr=('win_1r', 'mean'), avg_r=('pnl_r', 'mean'), tw=('_tw', 'sum'),
+              tl=('_tl', 'sum'), h1=('hit_1r', 'mean'), h15=('hit_15r', 'mean'), h2=('hit_2r', 'mean'),
+              mfe=('max_favorable_r', 'mean'), mae=('max_adverse_r', 'mean'))
+    a = a.loc[sorted(a.index)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pf = np.where(a['tl'] > 0, (a['tw'] / a['tl']).round(2), 999)
+    return pd.DataFrame({col_name: a.index.astype(str), 'Trades': a['n'].to_numpy(),
+        'Win Rate': (a['wr']*100).round(1).to_numpy(), 'Avg R': a['avg_r'].round(3).to_numpy(), 'PF': pf,
+        'Hit 1R%': (a['h1']*100).round(1).to_numpy(), 'Hit 1.5R%': (a['h15']*100).round(1).to_numpy(),
+        'Hit 2R%': (a['h2']*100).round(1).to_numpy(),
+        'Avg MFE': a['mfe'].round(2).to_numpy(), 'Avg MAE': a['mae'].round(2).to_numpy()})
+
+
+def scenario_breakdown(setups, min_trades=3):
+    """Per-scenario trade counts and long/short/overall win rates (scenarios with >= min_trades)."""
+    return _scenario_table(setups[['scenario_key', 'direction', 'win_1r']], min_trades)
+
+@cache_tables
+def _scenario_table(sub, min_trades):
+    g = sub.groupby(['scenario_key', 'direction'], observed=True)['win_1r'].agg(['sum', 'count'])
+    g = g.unstack('direction', fill_value=0)
+    n = g['count'].reindex(columns=['LONG', 'SHORT'], fill_value=0)
+    w = g['sum'].reindex(columns=['LONG', 'SHORT'], fill_value=0)
+    total = n.sum(axis=1); keep = total >= min_trades
+    n, w, total = n[keep], w[keep], total[keep]
+    pct = lambda x: (x*100).map('{:.1f}%'.format)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.DataFrame({'Scenario': n.index.astype(str), 'Total': total.to_numpy(),
+            'Longs': n['LONG'].to_numpy(), 'Shorts': n['SHORT'].to_numpy(),
+            'Long WR': np.where(n['LONG'] > 0, pct(w['LONG'] / n['LONG']), '—'),
+            'Short WR': np.where(n['SHORT'] > 0, pct(w['SHORT'] / n['SHORT']), '—'),
+            'Overall WR': pct(w.sum(axis=1) / total).to_numpy(),
+        }).sort_values('Total', ascending=False, kind='stable')
+
+def cell_breakdown(setups, keys, min_trades=3):
+    """Trades / WR% / PF / Avg MFE for every combination of `keys` ({column: display name})
+    with >= min_trades, best win rate first."""
+    return _cell_table(setups[[*keys, 'pnl_r', 'win_1r', 'max_favorable_r']], tuple(keys.items()), min_trades)
+
+@cache_tables
+def _cell_table(sub, keys, min_trades):
+    cols = [c for c, _ in keys]
+    pnl = sub['pnl_r']
+    a = sub.assign(_tw=pnl.clip(lower=0), _tl=-pnl.clip(upper=0)).groupby(cols, observed=True).agg(
+        n=('win_1r', 'size'), wr=('win_1r', 'mean'), tw=('_tw', 'sum'), tl=('_tl', 'sum'), mfe=('max_favorable_r', 'mean'))
+    a = a[a['n'] >= min_trades]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = a.assign(wr=(a['wr']*100).round(1), pf=np.where(a['tl'] > 0, (a['tw'] / a['tl']).round(2), 999),
+                     mfe=a['mfe'].round(2))
+    names = [name for _, name in keys]
+    return (a.reset_index().rename(columns={**dict(keys), 'n': 'Trades', 'wr': 'WR%', 'pf': 'PF', 'mfe': 'Avg MFE'})
+            [[*names, 'Trades', 'WR%', 'PF', 'Avg MFE']].sort_values('WR%', ascending=False, kind='stable'))
 
 
 # ─────────────────────────────────────────────────────────────
 # CHARTS
 # ─────────────────────────────────────────────────────────────
+EQUITY_MAX_POINTS = 5000
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of n_out points (first and last kept) that best
+    preserve the shape of the line (x, y). Returns all indices when the line is already short."""
+    n = len(x)
+    if n <= n_out or n_out < 3: return np.arange(n)
+    x = np.asarray(x, dtype=float); y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int); idx[0] = 0; idx[-1] = n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b+1]
+        nxt = slice(hi, edges[b+2] if b + 2 < len(edges) else n)
+        ax, ay = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - ax) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ay - y[a]))
+        a = lo + int(np.argmax(area)); idx[b+1] = a
+    return idx
+
 def plot_equity(s, title="Equity (R)"):
+    if len(s) > EQUITY_MAX_POINTS:
+        s = s.iloc[lttb(s['datetime'].to_numpy('int64'), s['cumulative_r'].to_numpy(), EQUITY_MAX_POINTS)]
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=s['datetime'],y=s['cumulative_r'],mode='lines',
+    fig.add_trace(go.Scattergl(x=s['datetime'],y=s['cumulative_r'],mode='lines',
         line=dict(color=COLORS['gold'],width=2),fill='tozeroy',fillcolor='rgba(255,215,0,0.08)'))
     fig.add_hline(y=0,line_dash="dash",line_color="gray",opacity=0.4)
     fig.update_layout(title=title,template='plotly_dark',height=370,margin=dict(l=40,r=40,t=50,b=40))
     return fig
 
+def rolling_mean(a, w):
+    """Trailing w-sample mean via a cumulative-sum difference; NaN for the first w-1 samples."""
+    cs = np.concatenate(([0.0], np.cumsum(a, dtype=float)))
+    out = np.full(len(a), np.nan)
+    if len(a) >= w: out[w-1:] = (cs[w:] - cs[:-w]) / w
+    return out
+
 def plot_rolling_wr(s, w=20):
     if len(s)<w: w=max(3,len(s)//2)
-    s=s.copy(); s['rwr']=s['win_1r'].rolling(w).mean()*100
+    rwr=rolling_mean(s['win_1r'].to_numpy(),w)*100
     fig=go.Figure()
-    fig.add_trace(go.Scatter(x=s['datetime'],y=s['rwr'],mode='lines',line=dict(color=COLORS['cyan'],width=2)))
+    fig.add_trace(go.Scattergl(x=s['datetime'],y=rwr,mode='lines',line=dict(color=COLORS['cyan'],width=2)))
     fig.add_hline(y=50,line_dash="dash",line_color="gray",opacity=0.4)
     fig.update_layout(title=f"Rolling Win Rate ({w}-trade)",template='plotly_dark',height=340,margin=dict(l=40,r=40,t=50,b=40))
     return fig
 
 def plot_bar(ds, xc, title):
-    cs=[COLORS['win'] if wr>55 else COLORS['loss'] if wr<45 else COLORS['gold'] for wr in ds['Win Rate']]
-    fig=go.Figure(go.Bar(x=ds[xc],y=ds['Win Rate'],marker_color=cs,
-        text=[f"{wr}%\nn={n}" for wr,n in zip(ds['Win Rate'],ds['Trades'])],textposition='outside',textfont=dict(size=10)))
+    wr=ds['Win Rate'].to_numpy(float); n=ds['Trades'].to_numpy()
+    cs=np.select([wr>55,wr<45],[COLORS['win'],COLORS['loss']],COLORS['gold'])
+    txt=np.char.add(np.char.add(wr.astype(str),'%\nn='),n.astype(str))
+    fig=go.Figure(go.Bar(x=ds[xc].to_numpy(),y=wr,marker_color=cs.tolist(),
+        text=txt.tolist(),textposition='outside',textfont=dict(size=10)))
     fig.add_hline(y=50,line_dash="dash",line_color="gray",opacity=0.4)
     fig.update_layout(title=title,template='plotly_dark',height=380,yaxis=dict(range=[0,100]),margin=dict(l=40,r=40,t=50,b=70))
     return fig
 
 def plot_monthly(s):
-    m=s.groupby('year_month').agg(trades=('win_1r','count'),wins=('win_1r','sum'),total_r=('pnl_r','sum')).reset_index()
+    m=s.groupby('year_month',observed=True,sort=True).agg(trades=('win_1r','count'),wins=('win_1r','sum'),total_r=('pnl_r','sum')).reset_index()
     m['wr']=m['wins']/m['trades']*100
     fig=make_subplots(specs=[[{"secondary_y":True}]])
-    fig.add_trace(go.Bar(x=m['year_month'],y=m['total_r'],marker_color=[COLORS['win'] if r>0 else COLORS['loss'] for r in m['total_r']],name='Total R'),secondary_y=False)
+    fig.add_trace(go.Bar(x=m['year_month'],y=m['total_r'],marker_color=np.where(m['total_r']>0,COLORS['win'],COLORS['loss']).tolist(),name='Total R'),secondary_y=False)
     fig.add_trace(go.Scatter(x=m['year_month'],y=m['wr'],mode='lines+markers',line=dict(color=COLORS['gold'],width=2),name='Win Rate %'),secondary_y=True)
     fig.update_layout(title='Monthly Performance',template='plotly_dark',height=370,margin=dict(l=40,r=40,t=50,b=70),xaxis_tickangle=-45)
     return fig
 
+def win_rate_pivot(s, rc, cc):
+    """Win rate and trade count tables (rc rows × cc columns) from a single groupby."""
+    return _win_rate_pivot(s[[rc,cc,'win_1r']],rc,cc)
+
+@cache_tables
+def _win_rate_pivot(sub, rc, cc):
+    g=sub.groupby([rc,cc],observed=True)['win_1r'].agg(['mean','count'])
+    g.index=g.index.remove_unused_levels()  # fixed categories: keep only observed rows/columns
+    g=g.unstack(cc)
+    return g['mean'], g['count'].fillna(0)
+
+def heatmap_text(pv, ct, min_n=0):
+    """Cell labels 'WR%\nn=count' for a win-rate pivot; blank where empty or count < min_n."""
+    v=pv.to_numpy(float)*100; c=np.nan_to_num(ct.to_numpy(float)).astype(int)
+    lbl=np.char.add(np.char.add(np.char.mod('%.0f',v),'%\nn='),np.char.mod('%d',c))
+    return np.where(~np.isnan(v)&(c>=min_n),lbl,'').tolist()
+
 def plot_heatmap(s, rc, cc, ro=None, title="Heatmap"):
-    pv=s.pivot_table(values='win_1r',index=rc,columns=cc,aggfunc='mean')
-    ct=s.pivot_table(values='win_1r',index=rc,columns=cc,aggfunc='count').fillna(0)
+    pv,ct=win_rate_pivot(s,rc,cc)
     if ro: pv=pv.reindex([r for r in ro if r in pv.index]); ct=ct.reindex([r for r in ro if r in ct.index])
-    txt=[]
-    for i in range(len(pv)):
-        row=[]
-        for j in range(len(pv.columns)):
-            v=pv.iloc[i,j]; c=ct.iloc[i,j] if not pd.isna(ct.iloc[i,j]) else 0
-            row.append(f"{v*100:.0f}%\nn={int(c)}" if not pd.isna(v) else '')
-        txt.append(row)
+    txt=heatmap_text(pv,ct)
     fig=go.Figure(go.Heatmap(z=pv.values*100,x=[str(c) for c in pv.columns],y=pv.index,
         colorscale=[[0,COLORS['loss']],[0.5,'#333'],[1,COLORS['win']]],zmid=50,
         text=txt,texttemplate="%{text}",textfont=dict(size=9),colorbar=dict(title='Win%')))
@@ -742,18 +1027,8 @@ def plot_heatmap(s, rc, cc, ro=None, title="Heatmap"):
     return fig
 
 def plot_scenario_matrix(s):
-    s=s.copy()
-    s['c1p']=s['c1_color']+' / '+s['c1_wick_bucket']
-    s['c2p']=s['c2_color']+' / '+s['c2_wick_bucket']
-    pv=s.pivot_table(values='win_1r',index='c1p',columns='c2p',aggfunc='mean')
-    ct=s.pivot_table(values='win_1r',index='c1p',columns='c2p',aggfunc='count').fillna(0)
-    txt=[]
-    for i in range(len(pv)):
-        row=[]
-        for j in range(len(pv.columns)):
-            v=pv.iloc[i,j]; c=ct.iloc[i,j] if not pd.isna(ct.iloc[i,j]) else 0
-            row.append(f"{v*100:.0f}%\nn={int(c)}" if not pd.isna(v) and c>=2 else '')
-        txt.append(row)
+    pv,ct=win_rate_pivot(s,'c1_profile','c2_profile')
+    txt=heatmap_text(pv,ct,min_n=2)
     fig=go.Figure(go.Heatmap(z=pv.values*100,x=pv.columns.tolist(),y=pv.index.tolist(),
         colorscale=[[0,COLORS['loss']],[0.5,'#444'],[1,COLORS['win']]],zmid=50,
         text=txt,texttemplate="%{text}",textfont=dict(size=9),colorbar=dict(title='Win%')))
@@ -761,19 +1036,31 @@ def plot_scenario_matrix(s):
         template='plotly_dark',height=max(450,len(pv)*55+120),margin=dict(l=160,r=40,t=60,b=120),xaxis_tickangle=-35)
     return fig
 
+def proximity_hover(d, label, col):
+    """Hover text for the zone-distance scatter, built column-wise: time, zone, strength and `label` R."""
+    return (d['datetime'].dt.strftime('%Y-%m-%d %H:%M') + '<br>Zone: ' + d['nearest_zone_type'].astype(str)
+            + '<br>Strength: ' + d['zone_strength'].astype(str) + f'×<br>{label}: '
+            + np.char.mod('%.1f', d[col].to_numpy(float)) + 'R').tolist()
+
+CANDLE_LABELS = [('C1: Big',COLORS['purple']),('C2: Inside',COLORS['blue']),('C3: Breakout',COLORS['orange']),
+                 ('C4',COLORS['gold']),('C5',COLORS['cyan']),('C6','#aaa')]
+
+def nearest_bar(index, ts):
+    """Position of the bar nearest to ts in a sorted DatetimeIndex (ties go to the later bar)."""
+    ns=index.asi8; t=pd.Timestamp(ts).value
+    j=int(np.searchsorted(ns,t))
+    if j==len(ns) or (j>0 and t-ns[j-1]<ns[j]-t): j-=1
+    return j
+
 def plot_candlestick_example(df, s, n_before=5, n_after=10):
-    idx=df.index.get_indexer([s['datetime']],method='nearest')[0]
+    idx=nearest_bar(df.index,s['datetime'])
     st_i=max(0,idx-n_before); en=min(len(df),idx+n_after); sub=df.iloc[st_i:en]
     fig=go.Figure(go.Candlestick(x=sub.index,open=sub['Open'],high=sub['High'],low=sub['Low'],close=sub['Close'],
         increasing_line_color=COLORS['win'],decreasing_line_color=COLORS['loss']))
-    labels = [(0,'C1: Big',COLORS['purple']),(1,'C2: Inside',COLORS['blue']),
-              (2,'C3: Breakout',COLORS['orange']),(3,'C4',COLORS['gold']),
-              (4,'C5',COLORS['cyan']),(5,'C6','#aaa')]
-    for off,lbl,clr in labels:
-        ci=idx+off
-        if ci<len(df):
-            c=df.iloc[ci]
-            fig.add_annotation(x=df.index[ci],y=c['High'],text=lbl,showarrow=True,arrowhead=2,arrowcolor=clr,font=dict(color=clr,size=9),yshift=12)
+    H=df['High'].to_numpy()
+    fig.update_layout(annotations=[dict(x=df.index[ci],y=H[ci],text=lbl,showarrow=True,arrowhead=2,arrowcolor=clr,
+                                        font=dict(color=clr,size=9),yshift=12)
+                                   for ci,(lbl,clr) in enumerate(CANDLE_LABELS,start=idx) if ci<len(df)])
     fig.add_hline(y=s['entry_price'],line_dash="dot",line_color=COLORS['gold'],opacity=0.5,annotation_text="Entry (C3 close)")
     fig.add_hline(y=s['stop_loss'],line_dash="dot",line_color=COLORS['loss'],opacity=0.5,annotation_text="SL")
     # Mark C2 range
@@ -786,6 +1073,427 @@ def plot_candlestick_example(df, s, n_before=5, n_after=10):
     return fig
 
 
+# ─────────────────────────────────────────────────────────────
+# RESULT SECTIONS
+# ─────────────────────────────────────────────────────────────
+# Each renderer draws one section of an asset/timeframe tab. `params` holds the zone
+# settings of the run that produced `result`.
+def render_overview(key, result, params):
+    """Equity, rolling win rate, monthly R, direction and C4-C6 follow-through."""
+    setups = result['setups']
+    st.plotly_chart(plot_equity(setups,f"Equity — {key}"),use_container_width=True)
+    c1,c2=st.columns(2)
+    with c1: st.plotly_chart(plot_rolling_wr(setups),use_container_width=True)
+    with c2: st.plotly_chart(plot_monthly(setups),use_container_width=True)
+    ds=result_seg(result,'direction','Direction')
+    st.plotly_chart(result_fig(result,'direction',plot_bar,ds,'Direction','Win Rate by Direction'),use_container_width=True)
+
+    st.markdown("---")
+    st.subheader("📊 C4 / C5 / C6 Follow-Through Analysis")
+    st.caption("After entering at C3 close, how often does each subsequent candle continue in the breakout direction?")
+
+    fc1,fc2,fc3,fc4 = st.columns(4)
+    c4_follow = setups['c4_followed'].mean()*100 if 'c4_followed' in setups.columns else 0
+    c5_follow = setups['c5_followed'].dropna().mean()*100 if 'c5_followed' in setups.columns else 0
+    c6_follow = setups['c6_followed'].dropna().mean()*100 if 'c6_followed' in setups.columns else 0
+    avg_follow = setups['follow_count'].mean() if 'follow_count' in setups.columns else 0
+    with fc1: st.metric("C4 Follow Rate", f"{c4_follow:.1f}%")
+    with fc2: st.metric("C5 Follow Rate", f"{c5_follow:.1f}%")
+    with fc3: st.metric("C6 Follow Rate", f"{c6_follow:.1f}%")
+    with fc4: st.metric("Avg Candles Following", f"{avg_follow:.1f}/3")
+
+    # Follow-through by direction
+    for d in ['LONG','SHORT']:
+        sub_d = setups[setups['direction']==d]
+        if len(sub_d) > 0:
+            c4f = sub_d['c4_followed'].mean()*100
+            c5f = sub_d['c5_followed'].dropna().mean()*100
+            c6f = sub_d['c6_followed'].dropna().mean()*100
+            st.markdown(f"**{d}**: C4={c4f:.0f}% C5={c5f:.0f}% C6={c6f:.0f}% "
+                        f"(avg {sub_d['follow_count'].mean():.1f}/3 followed, n={len(sub_d)})")
+
+    # Follow-through count as dimension
+    if 'follow_count' in setups.columns:
+        fc_stats = result_seg(result, 'follow_count', 'Candles Following (of 3)')
+        st.plotly_chart(result_fig(result, 'follow_count', plot_bar, fc_stats, 'Candles Following (of 3)',
+            'Win Rate by # Candles Following Breakout Direction'), use_container_width=True)
+
+    st.markdown("---")
+    st.subheader("📐 Breakout Margin Analysis")
+    st.caption("How far C3 closed beyond C2's range — does a stronger breakout predict better outcomes?")
+    if 'c3_breakout_margin_r' in setups.columns:
+        bm = stat_frame(setups, breakout_band=pd.cut(
+            setups['c3_breakout_margin_r'],
+            bins=[-0.01, 0.25, 0.5, 1.0, 1.5, float('inf')],
+            labels=['0-0.25R', '0.25-0.5R', '0.5-1.0R', '1.0-1.5R', '1.5R+']
+        ))
+        bm_stats = seg_analysis(bm, 'breakout_band', 'Breakout Margin')
+        st.plotly_chart(result_fig(result, 'breakout_margin', plot_bar, bm_stats, 'Breakout Margin',
+            'Win Rate by C3 Breakout Margin (distance beyond C2 range)'), use_container_width=True)
+        st.dataframe(bm_stats, use_container_width=True, hide_index=True)
+
+
+def render_scenarios(key, result, params):
+    """Scenario matrix, scenario breakdown table and wick profile win rates."""
+    setups = result['setups']
+    st.subheader("🧬 Scenario Matrix: C1 × C2 Profiles → Win Rate")
+    st.caption("Rows = Big candle color/wick profile. Columns = Inside bar color/wick profile. Cell = Win rate.")
+    st.plotly_chart(result_fig(result,'scenario_matrix',plot_scenario_matrix,setups),use_container_width=True)
+    st.markdown("---")
+
+    st.subheader("Scenario Breakdown Table")
+    sc_table = scenario_breakdown(setups)
+    if not sc_table.empty:
+        st.dataframe(sc_table, use_container_width=True, hide_index=True, height=500)
+
+    st.markdown("---")
+    st.subheader("Wick Profile Win Rates")
+    c1c,c2c=st.columns(2)
+    with c1c:
+        c1ws=result_seg(result,'c1_wick_label','C1 Wick')
+        st.plotly_chart(result_fig(result,'c1_wick',plot_bar,c1ws,'C1 Wick','C1 Wick → Win Rate'),use_container_width=True)
+    with c2c:
+        c2ws=result_seg(result,'c2_wick_label','C2 Wick')
+        st.plotly_chart(result_fig(result,'c2_wick',plot_bar,c2ws,'C2 Wick','C2 Wick → Win Rate'),use_container_width=True)
+
+    st.subheader("C1 Color × C2 Color")
+    st.plotly_chart(result_fig(result,'color_heatmap',plot_heatmap,setups,'c1_color','c2_color',title='Win Rate: C1 Color × C2 Color'),use_container_width=True)
+
+
+def render_zones(key, result, params):
+    """Supply/demand zone stats, proximity and strength analysis."""
+    setups = result['setups']
+    zone_lb, zone_prox, zone_strength_min = params['zone_lb'], params['zone_prox'], params['zone_strength_min']
+    st.subheader("🏗️ Supply & Demand Zone Analysis")
+
+    # ── Zone Definitions ──
+    with st.expander("📖 What Are Supply & Demand Zones? (Click to expand)", expanded=False):
+        st.markdown(f"""
+**How Zones Are Detected:**
+
+The dashboard identifies zones by scanning for **strong candles** — candles where the body
+(open-to-close distance) exceeds **{zone_strength_min}× the 14-period ATR** (configurable
+in the sidebar as "Min zone strength"). These represent moments of aggressive buying or selling.
+
+**Supply Zone (🔴 Selling Pressure):**
+A supply zone is created at the **origin of a strong bearish (red) candle**. The zone spans
+from the candle's high down to its open price. The logic: institutional sellers entered aggressively
+at this level. If price revisits, the same sellers (or similar order flow) may push price down again.
+
+**Demand Zone (🟢 Buying Pressure):**
+A demand zone is created at the **origin of a strong bullish (green) candle**. The zone spans
+from the candle's open price down to its low. Institutional buyers entered here — a revisit
+may find buyers again.
+
+**How Lookback Works:**
+The "Zone lookback" slider (currently **{zone_lb} hours ≈ {zone_lb//24} days**) controls how
+far back the dashboard looks for zones. Zones older than this are ignored — they've likely been
+consumed or invalidated.
+
+**How Proximity Works:**
+The "Zone proximity" slider (currently **{zone_prox}%**) determines how close the entry price
+must be to a zone boundary to classify the setup as "at a zone". At ~$2600 gold, {zone_prox}%
+≈ ${2600 * zone_prox / 100:.1f}. If the entry price is within this distance of any zone edge
+(or inside the zone itself), the setup is classified as being at that zone type.
+
+**Zone Strength:**
+Each zone has a strength rating = the originating candle's body ÷ ATR. A zone with strength
+2.5× means the candle that created it was 2.5 times the average range — a very aggressive move.
+Stronger zones may hold better when revisited.
+
+**Zone Classification for Each Setup:**
+- **Supply**: Entry price is near/inside a supply zone
+- **Demand**: Entry price is near/inside a demand zone
+- **Contested**: Both supply and demand zones overlap near the entry
+- **Neutral**: No recent zone is nearby
+""")
+
+    # ── Current Zone Stats ──
+    zones_data = result['zones']
+    if not zones_data.empty:
+        zc1, zc2, zc3 = st.columns(3)
+        supply_zones = zones_data[zones_data['zone_type']=='supply']
+        demand_zones = zones_data[zones_data['zone_type']=='demand']
+        with zc1:
+            st.metric("Total Zones Detected", len(zones_data))
+        with zc2:
+            st.metric("🔴 Supply Zones", len(supply_zones),
+                      f"Avg strength: {supply_zones['strength'].mean():.1f}×" if len(supply_zones)>0 else "")
+        with zc3:
+            st.metric("🟢 Demand Zones", len(demand_zones),
+                      f"Avg strength: {demand_zones['strength'].mean():.1f}×" if len(demand_zones)>0 else "")
+
+    st.markdown("---")
+
+    # ── Win Rate by Zone Type ──
+    st.subheader("Win Rate by Zone Classification")
+    zs=result_seg(result,'zone','Zone')
+    st.plotly_chart(result_fig(result,'zone',plot_bar,zs,'Zone','Win Rate by Zone'),use_container_width=True)
+    st.dataframe(zs, use_container_width=True, hide_index=True)
+
+    st.markdown("---")
+
+    # ── Zone × Direction Heatmap ──
+    st.subheader("Zone × Direction Interaction")
+    st.plotly_chart(result_fig(result,'zone_heatmap',plot_heatmap,setups,'zone','direction',title='Zone × Direction Win Rate'),use_container_width=True)
+
+    # ── With-Zone vs Against-Zone ──
+    st.subheader("With-Zone vs Against-Zone Edge")
+    st.caption("'With Zone' = LONG at demand or SHORT at supply (trading with expected zone reaction). "
+               "'Against Zone' = the opposite.")
+    zd=result_seg(result,'zone_dir','Zone Direction').set_index('Zone Direction')
+    ws,azs,ns=(zd.loc[k].to_dict() if k in zd.index else calc_stats(setups.iloc[:0]) for k in ('with','against','neutral'))
+    co1,co2,co3=st.columns(3)
+    with co1:
+        st.markdown("**✅ With Zone**")
+        st.metric("WR",f"{ws['Win Rate']}%",f"n={ws['Trades']}")
+        st.metric("PF",ws['PF'])
+        st.metric("Avg MFE",f"{ws['Avg MFE']}R")
+    with co2:
+        st.markdown("**❌ Against Zone**")
+        st.metric("WR",f"{azs['Win Rate']}%",f"n={azs['Trades']}")
+        st.metric("PF",azs['PF'])
+        st.metric("Avg MFE",f"{azs['Avg MFE']}R")
+    with co3:
+        st.markdown("**⚪ Neutral**")
+        st.metric("WR",f"{ns['Win Rate']}%",f"n={ns['Trades']}")
+        st.metric("PF",ns['PF'])
+        st.metric("Avg MFE",f"{ns['Avg MFE']}R")
+
+    st.markdown("---")
+
+    # ── NEW: Proximity Band Analysis ──
+    st.subheader("📏 Zone Proximity Analysis")
+    st.caption(f"How does win rate change based on distance from the nearest zone? "
+               f"Current proximity threshold: {zone_prox}% "
+               f"(≈${setups['entry_price'].mean() * zone_prox / 100:.1f} at current gold prices)")
+
+    prox_stats = result_seg(result, 'zone_proximity_band', 'Proximity Band')
+    # Order the bands logically
+    prox_stats = prox_stats.sort_values('Proximity Band', key=lambda b: b.map(PROXIMITY_ORDER).fillna(99))
+    st.plotly_chart(result_fig(result, 'proximity_band', plot_bar, prox_stats, 'Proximity Band',
+                               'Win Rate by Distance from Nearest Zone'), use_container_width=True)
+    st.dataframe(prox_stats, use_container_width=True, hide_index=True)
+
+    # Proximity scatter plot
+    prox_data = setups[setups['zone_dist_pct'].notna()]
+    if len(prox_data) > 5:
+        fig_prox = go.Figure()
+        wins_p = prox_data[prox_data['win_1r']==True]
+        losses_p = prox_data[prox_data['win_1r']==False]
+        fig_prox.add_trace(go.Scatter(
+            x=wins_p['zone_dist_pct'], y=wins_p['max_favorable_r'],
+            mode='markers', name='Wins',
+            marker=dict(color='#00c853', size=8, opacity=0.6),
+            text=proximity_hover(wins_p, 'MFE', 'max_favorable_r'),
+            hoverinfo='text',
+        ))
+        fig_prox.add_trace(go.Scatter(
+            x=losses_p['zone_dist_pct'], y=-losses_p['max_adverse_r'],
+            mode='markers', name='Losses',
+            marker=dict(color='#ff1744', size=8, opacity=0.6, symbol='x'),
+            text=proximity_hover(losses_p, 'MAE', 'max_adverse_r'),
+            hoverinfo='text',
+        ))
+        fig_prox.add_hline(y=0, line_dash="dash", line_color="gray", opacity=0.4)
+        fig_prox.add_vline(x=zone_prox, line_dash="dot", line_color="#ffd700", opacity=0.6,
+                           annotation_text=f"Proximity threshold ({zone_prox}%)")
+        fig_prox.update_layout(
+            title='Zone Distance vs Trade Outcome',
+            xaxis_title='Distance to Nearest Zone (%)',
+            yaxis_title='R-Multiple (positive=MFE, negative=MAE)',
+            template='plotly_dark', height=450,
+        )
+        st.plotly_chart(fig_prox, use_container_width=True)
+
+    st.markdown("---")
+
+    # ── NEW: Zone Strength Analysis ──
+    st.subheader("💪 Zone Strength Analysis")
+    st.caption("Does the strength of the zone (how aggressive the originating candle was) affect win rate?")
+
+    if setups['zone_strength'].notna().sum() > 5:
+        # Bin zone strength; setups without a zone get a NaN band, which the groupby drops
+        strength_data = stat_frame(setups, strength_band=pd.cut(
+            setups['zone_strength'],
+            bins=[0, 1.5, 2.0, 2.5, 3.0, float('inf')],
+            labels=['1.0-1.5×', '1.5-2.0×', '2.0-2.5×', '2.5-3.0×', '3.0×+']
+        ))
+        str_stats = seg_analysis(strength_data, 'strength_band', 'Zone Strength')
+        st.plotly_chart(result_fig(result, 'zone_strength', plot_bar, str_stats, 'Zone Strength',
+                                   'Win Rate by Zone Strength'), use_container_width=True)
+        st.dataframe(str_stats, use_container_width=True, hide_index=True)
+    else:
+        st.info("Not enough zone-classified setups for strength analysis.")
+
+    st.markdown("---")
+
+    # ── NEW: Proximity × Direction × Zone Table ──
+    st.subheader("🔬 Proximity × Zone × Direction")
+    prox_bd = cell_breakdown(setups, {'zone_proximity_band': 'Proximity', 'zone': 'Zone', 'direction': 'Dir'})
+    if not prox_bd.empty:
+        st.dataframe(prox_bd, use_container_width=True, hide_index=True, height=400,
+            column_config={'WR%': st.column_config.ProgressColumn('WR%', min_value=0, max_value=100, format="%.1f%%")})
+    else:
+        st.info("Not enough data for cross-dimensional proximity analysis (need ≥3 trades per cell).")
+
+
+def render_time(key, result, params):
+    """Session, weekday, month and day × hour win rates."""
+    setups = result['setups']
+    ss=result_seg(result,'session','Session')
+    st.plotly_chart(result_fig(result,'session',plot_bar,ss,'Session','Session Win Rate'),use_container_width=True)
+    dw=result_seg(result,'day_name','Day')
+    dw=dw.assign(Day=pd.Categorical(dw['Day'],['Mon','Tue','Wed','Thu','Fri'],ordered=True)).sort_values('Day')
+    st.plotly_chart(result_fig(result,'day',plot_bar,dw,'Day','Day of Week'),use_container_width=True)
+    ms=result_seg(result,'month_name','Month')
+    mo=['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
+    ms=ms.assign(Month=pd.Categorical(ms['Month'],mo,ordered=True)).sort_values('Month')
+    st.plotly_chart(result_fig(result,'month',plot_bar,ms,'Month','Month'),use_container_width=True)
+    st.plotly_chart(result_fig(result,'day_hour_heatmap',plot_heatmap,setups,'day_name','hour',ro=['Mon','Tue','Wed','Thu','Fri'],
+        title='Day × Hour Heatmap'),use_container_width=True)
+
+
+def render_news(key, result, params):
+    """Win rate around scheduled news events."""
+    ns=result_seg(result,'news','Event')
+    st.plotly_chart(result_fig(result,'news',plot_bar,ns,'Event','News Impact'),use_container_width=True)
+    st.dataframe(ns,use_container_width=True,hide_index=True)
+
+
+def render_breakdown(key, result, params):
+    """Alignment, zone proximity and multi-dimensional breakdown with significance test."""
+    setups = result['setups']
+    al=result_seg(result,'alignment','Alignment')
+    st.plotly_chart(result_fig(result,'alignment',plot_bar,al,'Alignment','Trend Alignment'),use_container_width=True)
+
+    # Zone proximity as a dimension
+    st.subheader("Zone Proximity Dimension")
+    prx=result_seg(result,'zone_proximity_band','Proximity')
+    prx=prx.sort_values('Proximity',key=lambda b: b.map(PROXIMITY_ORDER).fillna(99))
+    st.plotly_chart(result_fig(result,'proximity',plot_bar,prx,'Proximity','Win Rate by Zone Proximity'),use_container_width=True)
+    st.dataframe(prx,use_container_width=True,hide_index=True)
+
+    st.subheader("Multi-Dimensional Breakdown")
+    bd=cell_breakdown(setups,{'zone':'Zone','session':'Session','direction':'Dir'}).drop(columns='Avg MFE')
+    if not bd.empty:
+        st.dataframe(bd,use_container_width=True,hide_index=True,height=500,
+            column_config={'WR%':st.column_config.ProgressColumn('WR%',min_value=0,max_value=100,format="%.1f%%")})
+    st.subheader("Statistical Significance")
+    nn=len(setups); ww=int(setups['win_1r'].sum())
+    pv,lo,hi=win_rate_significance(ww,nn)
+    st.markdown(f"**{ww/nn*100:.1f}%** ({ww}/{nn}) | p={pv:.4f} | 95% CI: {lo*100:.1f}%-{hi*100:.1f}% | {'✅ Significant' if pv<0.05 else '❌ Not significant'}")
+
+
+def render_log(key, result, params):
+    """Filterable setup log with narratives and CSV export."""
+    setups = result['setups']
+    st.subheader("📝 Complete Setup Log with Narratives")
+    f1,f2,f3,f4=st.columns(4)
+    with f1: fd=st.selectbox("Direction",['All','LONG','SHORT'],key=f"fd_{key}")
+    with f2: fz=st.selectbox("Zone",result_options(result,'zone'),key=f"fz_{key}")
+    with f3: fs=st.selectbox("Session",result_options(result,'session'),key=f"fs_{key}")
+    with f4: fr=st.selectbox("Result",['All','Wins','Losses'],key=f"fr_{key}")
+
+    fp1,fp2=st.columns(2)
+    with fp1: fpx=st.selectbox("Zone Proximity",result_options(result,'zone_proximity_band'),key=f"fpx_{key}")
+    with fp2: scf=st.selectbox("Scenario filter",result_options(result,'scenario_key'),key=f"sc_{key}")
+
+    # Intersect the cached row positions of each active filter instead of masking the frame
+    sel=[(c,v) for c,v in (('direction',fd),('zone',fz),('session',fs),('zone_proximity_band',fpx),('scenario_key',scf))
+         if v!='All' and c in setups.columns]
+    if fr!='All': sel.append(('win_1r',fr=='Wins'))
+    picks=[result_rows(result,c).get(v,np.empty(0,dtype=np.intp)) for c,v in sel]
+    filt=setups.iloc[functools.reduce(np.intersect1d,picks)] if picks else setups
+
+    srt=st.radio("Sort:",['Recent','Oldest','Best R','Worst R'],horizontal=True,key=f"sr_{key}")
+    if srt=='Recent': filt=filt.sort_values('datetime',ascending=False)
+    elif srt=='Oldest': filt=filt.sort_values('datetime',ascending=True)
+    elif srt=='Best R': filt=filt.sort_values('max_favorable_r',ascending=False)
+    else: filt=filt.sort_values('max_adverse_r',ascending=False)
+    st.markdown(f"**{len(filt)} of {len(setups)} setups**")
+
+    # C4-C6 follow-through and target-hit lines for every listed setup, built column-wise
+    tick=lambda c: np.where(filt[c].to_numpy(bool),'✅','❌').astype(object)
+    num=lambda c,fmt='%.2f': np.char.mod(fmt,filt[c].to_numpy(float)).astype(object)
+    follow_md=[f'**C{k}** '+tick(f'c{k}_followed')+' '+num(f'c{k}_close_r','%+.2f')+'R' for k in (4,5,6)]
+    summary_md=('**'+filt['follow_count'].astype(str).to_numpy(object)+'/3 followed** | 1R:'+tick('hit_1r')
+                +' 1.5R:'+tick('hit_15r')+' 2R:'+tick('hit_2r')+' | MFE:'+num('max_favorable_r')+'R MAE:'+num('max_adverse_r')+'R')
+
+    # Plain dict rows: same s['col'] / s.get access as a Series, without building one per row
+    for idx,s in enumerate(filt.to_dict('records')):
+        res="✅ WIN" if s['win_1r'] else "❌ LOSS"
+        dist_txt = f" | Dist:{s['zone_dist_pct']:.2f}%" if pd.notna(s.get('zone_dist_pct')) else ""
+        str_txt = f" Str:{s['zone_strength']:.1f}×" if pd.notna(s.get('zone_strength')) else ""
+        with st.expander(
+            f"**#{idx+1}** {s['datetime'].strftime('%a %b %d, %Y %H:%M')} | {s['direction']} | {res} | "
+            f"{s['zone']}{dist_txt}{str_txt} | {s['session']} | C1:{s['c1_color']}/{s['c1_wick_bucket']} → C2:{s['c2_color']}/{s['c2_wick_bucket']}"):
+            st.markdown(memo(result, ('narrative', s['datetime']), generate_narrative, s))
+            st.markdown("---")
+
+            # Zone detail box
+            if s['zone'] != 'neutral':
+                zc1,zc2,zc3=st.columns(3)
+                with zc1:
+                    st.markdown(f"**🏗️ Zone Type:** {s['zone'].upper()}")
+                    if pd.notna(s.get('nearest_zone_top')):
+                        st.markdown(f"**Zone Range:** ${s['nearest_zone_bottom']:.2f} — ${s['nearest_zone_top']:.2f}")
+                with zc2:
+                    if pd.notna(s.get('zone_dist_pct')):
+                        st.markdown(f"**Distance:** {s['zone_dist_pct']:.3f}%")
+                        st.markdown(f"**Band:** {s['zone_proximity_band']}")
+                with zc3:
+                    if pd.notna(s.get('zone_strength')):
+                        st.markdown(f"**Strength:** {s['zone_strength']:.1f}× ATR")
+                    wz = ((s['zone']=='demand' and s['direction']=='LONG') or
+                          (s['zone']=='supply' and s['direction']=='SHORT'))
+                    st.markdown(f"**Alignment:** {'✅ With Zone' if wz else '⚠️ Against Zone'}")
+                st.markdown("---")
+
+            co1,co2=st.columns(2)
+            with co1:
+                st.markdown(f"**C1** O:${s['c1_open']:.2f} C:${s['c1_close']:.2f} H:${s['c1_high']:.2f} L:${s['c1_low']:.2f}\n\n"
+                    f"Body:{s['c1_body_pct']:.1f}% UW:{s['c1_upper_wick_pct']:.1f}% LW:{s['c1_lower_wick_pct']:.1f}% | {s['c1_wick_label']}")
+            with co2:
+                st.markdown(f"**C2** O:${s['c2_open']:.2f} C:${s['c2_close']:.2f} H:${s['c2_high']:.2f} L:${s['c2_low']:.2f}\n\n"
+                    f"Body:{s['c2_body_pct']:.1f}% UW:{s['c2_upper_wick_pct']:.1f}% LW:{s['c2_lower_wick_pct']:.1f}% | {s['c2_wick_label']}")
+            st.markdown(f"**C3 Breakout:** {s['c3_open']:.2f}→**{s['c3_close']:.2f}** "
+                f"({'above C2 high '+str(round(s['c2_high'],2)) if s['direction']=='LONG' else 'below C2 low '+str(round(s['c2_low'],2))} "
+                f"by ${s['c3_breakout_margin']:.2f}) → **{s['direction']}** | "
+                f"Entry @ C3 close: **${s['entry_price']:.2f}** | SL:${s['stop_loss']:.2f} | Risk:${s['risk']:.2f}")
+            # C4/C5/C6 follow-through
+            for col,md in zip(st.columns(3),follow_md):
+                with col: st.markdown(md[idx])
+            st.markdown(summary_md[idx])
+
+    st.markdown("---")
+    # Re-serialize only when the filters/sort change; other reruns reuse the last CSV
+    csv_key=(fd,fz,fs,fr,fpx,scf,srt)
+    if result.get('csv_key')!=csv_key:
+        result['csv'],result['csv_key']=filt.to_csv(index=False),csv_key
+    csv=result['csv']
+    st.download_button(f"⬇️ CSV ({len(filt)} setups)",csv,f"setups_{key.replace(' ','_')}.csv","text/csv",key=f"dl_{key}")
+
+
+def render_examples(key, result, params):
+    """Candlestick charts of example setups."""
+    setups = result['setups']; df = result['df']
+    ne=min(6,len(setups))
+    et=st.radio("Show:",['Recent','Best Winners','Worst Losers','Random'],horizontal=True,key=f"ex_{key}")
+    if et=='Recent': ex=setups.tail(ne)
+    elif et=='Best Winners': ex=setups[setups['win_1r']].nlargest(ne,'max_favorable_r')
+    elif et=='Worst Losers': ex=setups[~setups['win_1r']].nlargest(ne,'max_adverse_r')
+    else: ex=setups.sample(min(ne,len(setups)))
+    for _,s in ex.iterrows():
+        ts=s['datetime']
+        fig=memo(result,('example',ts),plot_candlestick_example,df,s)
+        st.plotly_chart(fig,use_container_width=True,key=f"cx_{key}_{ts}")
+
+SECTIONS = {"📈 Overview": render_overview, "🧬 Scenarios": render_scenarios, "🏗️ Zones": render_zones,
+            "🕐 Time": render_time, "📰 News": render_news, "🔍 Breakdown": render_breakdown,
+            "📝 Log": render_log, "🕯️ Examples": render_examples}
+
+
 # ─────────────────────────────────────────────────────────────
 # MAIN
 # ─────────────────────────────────────────────────────────────
@@ -797,9 +1505,7 @@ def main():
         st.header("⚙️ Configuration")
         st.subheader("🔍 Asset Selection")
         categories = st.multiselect("Categories", list(ASSET_CATEGORIES.keys()), default=["🏆 Commodities"])
-        available = {}
-        for cat in categories:
-            available.update(ASSET_CATEGORIES[cat])
+        available = {name: t for cat in categories for name, t in ASSET_CATEGORIES[cat].items()}
         if not available:
             st.warning("Select at least one category."); return
         selected = st.multiselect("Assets", list(available.keys()),
@@ -862,54 +1568,59 @@ def main():
             """)
         return
 
-    event_dates = get_major_event_dates()
-    all_results = {}
-    all_diagnostics = {}
-    progress = st.progress(0, text="Starting...")
-    total = len(selected) * len(timeframes); ti = 0
-
-    for aname in selected:
-        ticker = available[aname]
-        # Cache dataframes per interval to avoid re-fetching
-        fetched_dfs = {}
-
-        for tf in timeframes:
-            ti += 1
-            progress.progress(ti/max(total,1), text=f"Fetching {aname} {tf}...")
-
-            # Determine which raw interval to fetch
-            if tf in ['15m', '30m']:
-                raw_interval = tf
-                if raw_interval not in fetched_dfs:
-                    try:
-                        fetched_dfs[raw_interval] = fetch_asset_data(ticker, interval=raw_interval, period_years=data_years)
-                    except Exception as e:
-                        st.warning(f"Failed {aname} {tf}: {e}"); continue
-                df = fetched_dfs[raw_interval]
-            elif tf in ['1H', '4H']:
-                if '1h' not in fetched_dfs:
-                    try:
-                        fetched_dfs['1h'] = fetch_asset_data(ticker, interval='1h', period_years=data_years)
-                    except Exception as e:
-                        st.warning(f"Failed {aname} {tf}: {e}"); continue
-                if tf == '1H':
-                    df = fetched_dfs['1h']
-                else:
-                    df = resample_to_4h(fetched_dfs['1h'])
-
-            if df is None or df.empty or len(df) < 50:
-                st.warning(f"Insufficient data for {aname} {tf} ({len(df) if df is not None else 0} candles)")
-                continue
-
-            progress.progress(ti/max(total,1), text=f"Detecting: {aname} {tf} ({len(df):,} candles)...")
-
-            # Detect zones
-            zones = detect_zones(df, zone_strength_min)
-
-            # Detect setups WITH diagnostics
-            setups, diag = detect_setups_with_diagnostics(df, body_ratio, atr_mult)
-
-            key = f"{aname} — {tf}"
+    if run:
+        event_dates = get_major_event_dates()
+        all_results = {}
+        all_diagnostics = {}
+        progress = st.progress(0, text="Starting...")
+        total = len(selected) * len(timeframes); ti = 0
+
+        # Fetch every selected ticker for each raw interval up front, concurrently
+        progress.progress(0, text=f"Fetching {len(selected)} asset(s)...")
+        prefetched = {raw: fetch_assets_batch([available[a] for a in selected], interval=raw, period_years=data_years)
+                      for raw in sorted({RAW_INTERVAL[tf] for tf in timeframes})}
+
+        # Fetch/resample on the script thread (it reports warnings), then find zones,
+        # detect and enrich every asset/timeframe concurrently
+        jobs = {}
+        for aname in selected:
+            ticker = available[aname]
+            # Raw dataframes per interval fetched so far for this asset
+            fetched_dfs = {}
+
+            for tf in timeframes:
+                ti += 1
+                progress.progress(ti/max(2*total,1), text=f"Preparing {aname} {tf}...")
+
+                raw_interval = RAW_INTERVAL[tf]
+                fetched = prefetched[raw_interval][ticker]
+                if isinstance(fetched, Exception):
+                    st.warning(f"Failed {aname} {tf}: {fetched}"); continue
+                fetched_dfs[raw_interval] = fetched
+                df = TF_RESAMPLE[tf](fetched) if tf in TF_RESAMPLE else fetched
+
+                if df is None or df.empty or len(df) < 50:
+                    st.warning(f"Insufficient data for {aname} {tf} ({len(df) if df is not None else 0} candles)")
+                    continue
+
+                # Enrich — use the 1h df if available for daily vol, otherwise use the tf df
+                enrich_df = fetched_dfs.get('1h', df)
+                jobs[f"{aname} — {tf}"] = (aname, ticker, tf, df, enrich_df)
+
+        done = {}
+        if jobs:
+            with script_thread_pool(min(8, len(jobs))) as ex:
+                futs = {ex.submit(analyze_timeframe, df, enrich_df, event_dates,
+                                  body_ratio, atr_mult, zone_lb, zone_prox, zone_strength_min): key
+                        for key, (_, _, _, df, enrich_df) in jobs.items()}
+                for fut in as_completed(futs):
+                    done[futs[fut]] = fut.result()
+                    ti += 1
+                    progress.progress(ti/max(2*total,1), text=f"Detected: {futs[fut]} ({len(done)}/{len(jobs)})")
+
+        # Collect in selection order so tabs and diagnostics stay stable
+        for key, (aname, ticker, tf, df, _) in jobs.items():
+            zones, setups, diag = done[key]
             all_diagnostics[key] = diag
             all_diagnostics[key]['total_candles'] = len(df)
             all_diagnostics[key]['date_range'] = f"{df.index[0].strftime('%Y-%m-%d')} to {df.index[-1].strftime('%Y-%m-%d')}"
@@ -917,48 +1628,27 @@ def main():
             if setups.empty:
                 st.warning(f"No setups for {key} — see diagnostics below")
                 continue
-
-            # Enrich — use the 1h df if available for daily vol, otherwise use the tf df
-            enrich_df = fetched_dfs.get('1h', df)
-            setups = enrich_setups(setups, enrich_df, zones, event_dates,
-                                   zone_lookback=zone_lb, zone_proximity=zone_prox)
             all_results[key] = {'setups':setups,'df':df,'zones':zones,'asset':aname,'ticker':ticker,'tf':tf}
 
-    progress.empty()
+        progress.empty()
+        st.session_state['results'] = all_results
+        st.session_state['diagnostics'] = all_diagnostics
+        st.session_state['run_params'] = (body_ratio, atr_mult, zone_lb, zone_prox, zone_strength_min)
+    else:
+        # Widget interaction without a new Run: reuse the last analysis instead of recomputing it
+        all_results = st.session_state['results']
+        all_diagnostics = st.session_state.get('diagnostics', {})
+        body_ratio, atr_mult, zone_lb, zone_prox, zone_strength_min = st.session_state['run_params']
 
     # ── Show diagnostics for ALL timeframes including ones with 0 setups ──
     with st.expander("🔬 Setup Detection Diagnostics — Why are there this many (or few) setups?", expanded=True):
         st.caption("This funnel shows how many candles pass each filter stage. "
                    "If too few setups, look for the biggest drop-off and adjust that slider.")
-        for key, diag in all_diagnostics.items():
+        funnel = funnel_table(all_diagnostics, body_ratio, atr_mult)
+        for key, rows in funnel.groupby('key', sort=False):
+            diag = all_diagnostics[key]
             st.markdown(f"**{key}** — {diag['date_range']} — {diag['total_candles']:,} candles")
-            funnel_data = {
-                'Stage': [
-                    f"1. Total candles scanned",
-                    f"2. Pass C1 body ratio (≥{body_ratio*100:.0f}%)",
-                    f"3. Pass C1 body size (≥{atr_mult}× ATR)",
-                    f"4. Pass C1 body ratio AND size",
-                    f"5. C2 is inside bar (H≤C1H, L≥C1L)",
-                    f"6. C3 closes beyond C2 range",
-                    f"7. Valid risk (entry - SL > 0)",
-                ],
-                'Count': [
-                    diag['total_scanned'],
-                    diag['pass_body_ratio'],
-                    diag['pass_body_atr'],
-                    diag['pass_both_c1'],
-                    diag['pass_inside_bar'],
-                    diag['pass_c3_breakout'],
-                    diag['pass_valid_risk'],
-                ],
-            }
-            funnel_df = pd.DataFrame(funnel_data)
-            funnel_df['% of Total'] = (funnel_df['Count'] / max(diag['total_scanned'],1) * 100).round(1)
-            funnel_df['Drop-off'] = ['—'] + [
-                f"-{funnel_df['Count'].iloc[i-1] - funnel_df['Count'].iloc[i]:,}"
-                for i in range(1, len(funnel_df))
-            ]
-            st.dataframe(funnel_df, use_container_width=True, hide_index=True)
+            st.dataframe(rows.drop(columns='key'), use_container_width=True, hide_index=True)
             st.markdown("---")
 
     if not all_results:
@@ -972,14 +1662,19 @@ def main():
 - **Big drop at Stage 6 (C3 breakout)?** → This is the strictest rule. C3 must CLOSE above C2 high or below C2 low. This is correct per your strategy.
         """)
         return
-    st.session_state['results'] = all_results
     st.success(f"Found setups across {len(all_results)} asset/timeframe combinations")
 
     tab_names = list(all_results.keys())
     if len(all_results) > 1: tab_names.append("📋 Cross-Asset Comparison")
-    tabs = st.tabs(tab_names)
+    # Lazy tabs where supported: only the open tab's body runs. Older Streamlit builds every tab.
+    try:
+        tabs, lazy = st.tabs(tab_names, key="result_tab", on_change="rerun"), True
+    except TypeError:
+        tabs, lazy = st.tabs(tab_names), False
+    params = {'zone_lb': zone_lb, 'zone_prox': zone_prox, 'zone_strength_min': zone_strength_min}
 
     for tab_i, (key, result) in enumerate(all_results.items()):
+        if lazy and not tabs[tab_i].open: continue
         setups = result['setups']; df = result['df']
         with tabs[tab_i]:
             st.header(f"{key} — {len(setups)} Setups")
@@ -998,481 +1693,49 @@ def main():
             m5.metric("C4 Follow Rate",f"{c4f_rate:.0f}%")
             m6.metric("Hit 2R",f"{ov['Hit 2R%']}%")
 
-            inner = st.tabs(["📈 Overview","🧬 Scenarios","🏗️ Zones","🕐 Time","📰 News","🔍 Breakdown","📝 Log","🕯️ Examples"])
-
-            with inner[0]:
-                st.plotly_chart(plot_equity(setups,f"Equity — {key}"),use_container_width=True)
-                c1,c2=st.columns(2)
-                with c1: st.plotly_chart(plot_rolling_wr(setups),use_container_width=True)
-                with c2: st.plotly_chart(plot_monthly(setups),use_container_width=True)
-                ds=seg_analysis(setups,'direction','Direction')
-                st.plotly_chart(plot_bar(ds,'Direction','Win Rate by Direction'),use_container_width=True)
-
-                st.markdown("---")
-                st.subheader("📊 C4 / C5 / C6 Follow-Through Analysis")
-                st.caption("After entering at C3 close, how often does each subsequent candle continue in the breakout direction?")
-
-                fc1,fc2,fc3,fc4 = st.columns(4)
-                c4_follow = setups['c4_followed'].mean()*100 if 'c4_followed' in setups.columns else 0
-                c5_follow = setups['c5_followed'].dropna().mean()*100 if 'c5_followed' in setups.columns else 0
-                c6_follow = setups['c6_followed'].dropna().mean()*100 if 'c6_followed' in setups.columns else 0
-                avg_follow = setups['follow_count'].mean() if 'follow_count' in setups.columns else 0
-                with fc1: st.metric("C4 Follow Rate", f"{c4_follow:.1f}%")
-                with fc2: st.metric("C5 Follow Rate", f"{c5_follow:.1f}%")
-                with fc3: st.metric("C6 Follow Rate", f"{c6_follow:.1f}%")
-                with fc4: st.metric("Avg Candles Following", f"{avg_follow:.1f}/3")
-
-                # Follow-through by direction
-                for d in ['LONG','SHORT']:
-                    sub_d = setups[setups['direction']==d]
-                    if len(sub_d) > 0:
-                        c4f = sub_d['c4_followed'].mean()*100
-                        c5f = sub_d['c5_followed'].dropna().mean()*100
-                        c6f = sub_d['c6_followed'].dropna().mean()*100
-                        st.markdown(f"**{d}**: C4={c4f:.0f}% C5={c5f:.0f}% C6={c6f:.0f}% "
-                                    f"(avg {sub_d['follow_count'].mean():.1f}/3 followed, n={len(sub_d)})")
-
-                # Follow-through count as dimension
-                if 'follow_count' in setups.columns:
-                    fc_stats = seg_analysis(setups, 'follow_count', 'Candles Following (of 3)')
-                    st.plotly_chart(plot_bar(fc_stats, 'Candles Following (of 3)',
-                        'Win Rate by # Candles Following Breakout Direction'), use_container_width=True)
-
-                st.markdown("---")
-                st.subheader("📐 Breakout Margin Analysis")
-                st.caption("How far C3 closed beyond C2's range — does a stronger breakout predict better outcomes?")
-                if 'c3_breakout_margin_r' in setups.columns:
-                    bm = setups.copy()
-                    bm['breakout_band'] = pd.cut(
-                        bm['c3_breakout_margin_r'],
-                        bins=[-0.01, 0.25, 0.5, 1.0, 1.5, float('inf')],
-                        labels=['0-0.25R', '0.25-0.5R', '0.5-1.0R', '1.0-1.5R', '1.5R+']
-                    ).astype(str)
-                    bm_stats = seg_analysis(bm, 'breakout_band', 'Breakout Margin')
-                    st.plotly_chart(plot_bar(bm_stats, 'Breakout Margin',
-                        'Win Rate by C3 Breakout Margin (distance beyond C2 range)'), use_container_width=True)
-                    st.dataframe(bm_stats, use_container_width=True, hide_index=True)
-
-            with inner[1]:
-                st.subheader("🧬 Scenario Matrix: C1 × C2 Profiles → Win Rate")
-                st.caption("Rows = Big candle color/wick profile. Columns = Inside bar color/wick profile. Cell = Win rate.")
-                st.plotly_chart(plot_scenario_matrix(setups),use_container_width=True)
-                st.markdown("---")
-
-                st.subheader("Scenario Breakdown Table")
-                sc_rows = []
-                for sc in setups['scenario_key'].unique():
-                    sub = setups[setups['scenario_key']==sc]
-                    if len(sub)>=3:
-                        ln=(sub['direction']=='LONG').sum(); sn=(sub['direction']=='SHORT').sum()
-                        lw=sub[sub['direction']=='LONG']['win_1r'].mean()*100 if ln>0 else None
-                        sw=sub[sub['direction']=='SHORT']['win_1r'].mean()*100 if sn>0 else None
-                        sc_rows.append({'Scenario':sc,'Total':len(sub),'Longs':ln,'Shorts':sn,
-                            'Long WR':f"{lw:.1f}%" if lw is not None else '—',
-                            'Short WR':f"{sw:.1f}%" if sw is not None else '—',
-                            'Overall WR':f"{sub['win_1r'].mean()*100:.1f}%"})
-                if sc_rows:
-                    st.dataframe(pd.DataFrame(sc_rows).sort_values('Total',ascending=False),
-                        use_container_width=True,hide_index=True,height=500)
-
-                st.markdown("---")
-                st.subheader("Wick Profile Win Rates")
-                c1c,c2c=st.columns(2)
-                with c1c:
-                    c1ws=seg_analysis(setups,'c1_wick_label','C1 Wick')
-                    st.plotly_chart(plot_bar(c1ws,'C1 Wick','C1 Wick → Win Rate'),use_container_width=True)
-                with c2c:
-                    c2ws=seg_analysis(setups,'c2_wick_label','C2 Wick')
-                    st.plotly_chart(plot_bar(c2ws,'C2 Wick','C2 Wick → Win Rate'),use_container_width=True)
-
-                st.subheader("C1 Color × C2 Color")
-                st.plotly_chart(plot_heatmap(setups,'c1_color','c2_color',title='Win Rate: C1 Color × C2 Color'),use_container_width=True)
-
-            with inner[2]:
-                st.subheader("🏗️ Supply & Demand Zone Analysis")
-
-                # ── Zone Definitions ──
-                with st.expander("📖 What Are Supply & Demand Zones? (Click to expand)", expanded=False):
-                    st.markdown(f"""
-**How Zones Are Detected:**
-
-The dashboard identifies zones by scanning for **strong candles** — candles where the body
-(open-to-close distance) exceeds **{zone_strength_min}× the 14-period ATR** (configurable
-in the sidebar as "Min zone strength"). These represent moments of aggressive buying or selling.
+            # Only the selected section is built on each rerun (st.tabs would build all eight)
+            section = st.radio("Section", list(SECTIONS), horizontal=True, key=f"sec_{key}",
+                               label_visibility="collapsed")
+            placeholder = st.empty()
+            placeholder.caption(f"Loading {section}…")
+            with placeholder.container():
+                SECTIONS[section](key, result, params)
 
-**Supply Zone (🔴 Selling Pressure):**
-A supply zone is created at the **origin of a strong bearish (red) candle**. The zone spans
-from the candle's high down to its open price. The logic: institutional sellers entered aggressively
-at this level. If price revisits, the same sellers (or similar order flow) may push price down again.
-
-**Demand Zone (🟢 Buying Pressure):**
-A demand zone is created at the **origin of a strong bullish (green) candle**. The zone spans
-from the candle's open price down to its low. Institutional buyers entered here — a revisit
-may find buyers again.
-
-**How Lookback Works:**
-The "Zone lookback" slider (currently **{zone_lb} hours ≈ {zone_lb//24} days**) controls how
-far back the dashboard looks for zones. Zones older than this are ignored — they've likely been
-consumed or invalidated.
-
-**How Proximity Works:**
-The "Zone proximity" slider (currently **{zone_prox}%**) determines how close the entry price
-must be to a zone boundary to classify the setup as "at a zone". At ~$2600 gold, {zone_prox}%
-≈ ${2600 * zone_prox / 100:.1f}. If the entry price is within this distance of any zone edge
-(or inside the zone itself), the setup is classified as being at that zone type.
-
-**Zone Strength:**
-Each zone has a strength rating = the originating candle's body ÷ ATR. A zone with strength
-2.5× means the candle that created it was 2.5 times the average range — a very aggressive move.
-Stronger zones may hold better when revisited.
-
-**Zone Classification for Each Setup:**
-- **Supply**: Entry price is near/inside a supply zone
-- **Demand**: Entry price is near/inside a demand zone
-- **Contested**: Both supply and demand zones overlap near the entry
-- **Neutral**: No recent zone is nearby
-""")
-
-                # ── Current Zone Stats ──
-                zones_data = result['zones']
-                if not zones_data.empty:
-                    zc1, zc2, zc3 = st.columns(3)
-                    supply_zones = zones_data[zones_data['zone_type']=='supply']
-                    demand_zones = zones_data[zones_data['zone_type']=='demand']
-                    with zc1:
-                        st.metric("Total Zones Detected", len(zones_data))
-                    with zc2:
-                        st.metric("🔴 Supply Zones", len(supply_zones),
-                                  f"Avg strength: {supply_zones['strength'].mean():.1f}×" if len(supply_zones)>0 else "")
-                    with zc3:
-                        st.metric("🟢 Demand Zones", len(demand_zones),
-                                  f"Avg strength: {demand_zones['strength'].mean():.1f}×" if len(demand_zones)>0 else "")
-
-                st.markdown("---")
-
-                # ── Win Rate by Zone Type ──
-                st.subheader("Win Rate by Zone Classification")
-                zs=seg_analysis(setups,'zone','Zone')
-                st.plotly_chart(plot_bar(zs,'Zone','Win Rate by Zone'),use_container_width=True)
-                st.dataframe(zs, use_container_width=True, hide_index=True)
-
-                st.markdown("---")
-
-                # ── Zone × Direction Heatmap ──
-                st.subheader("Zone × Direction Interaction")
-                st.plotly_chart(plot_heatmap(setups,'zone','direction',title='Zone × Direction Win Rate'),use_container_width=True)
-
-                # ── With-Zone vs Against-Zone ──
-                st.subheader("With-Zone vs Against-Zone Edge")
-                st.caption("'With Zone' = LONG at demand or SHORT at supply (trading with expected zone reaction). "
-                           "'Against Zone' = the opposite.")
-                wz=setups[((setups['zone']=='demand')&(setups['direction']=='LONG'))|((setups['zone']=='supply')&(setups['direction']=='SHORT'))]
-                az=setups[((setups['zone']=='demand')&(setups['direction']=='SHORT'))|((setups['zone']=='supply')&(setups['direction']=='LONG'))]
-                nz=setups[setups['zone']=='neutral']
-                co1,co2,co3=st.columns(3)
-                ws=calc_stats(wz);azs=calc_stats(az);ns=calc_stats(nz)
-                with co1:
-                    st.markdown("**✅ With Zone**")
-                    st.metric("WR",f"{ws['Win Rate']}%",f"n={ws['Trades']}")
-                    st.metric("PF",ws['PF'])
-                    st.metric("Avg MFE",f"{ws['Avg MFE']}R")
-                with co2:
-                    st.markdown("**❌ Against Zone**")
-                    st.metric("WR",f"{azs['Win Rate']}%",f"n={azs['Trades']}")
-                    st.metric("PF",azs['PF'])
-                    st.metric("Avg MFE",f"{azs['Avg MFE']}R")
-                with co3:
-                    st.markdown("**⚪ Neutral**")
-                    st.metric("WR",f"{ns['Win Rate']}%",f"n={ns['Trades']}")
-                    st.metric("PF",ns['PF'])
-                    st.metric("Avg MFE",f"{ns['Avg MFE']}R")
-
-                st.markdown("---")
-
-                # ── NEW: Proximity Band Analysis ──
-                st.subheader("📏 Zone Proximity Analysis")
-                st.caption(f"How does win rate change based on distance from the nearest zone? "
-                           f"Current proximity threshold: {zone_prox}% "
-                           f"(≈${setups['entry_price'].mean() * zone_prox / 100:.1f} at current gold prices)")
-
-                prox_stats = seg_analysis(setups, 'zone_proximity_band', 'Proximity Band')
-                # Order the bands logically
-                band_order = ['Inside Zone', 'Touching (≤0.1%)', 'Very Close (0.1-0.3%)',
-                              'Near (0.3-0.6%)', 'Moderate (0.6-1%)', 'Far (>1%)', 'No Zone']
-                prox_stats['sort_key'] = prox_stats['Proximity Band'].apply(
-                    lambda x: band_order.index(x) if x in band_order else 99)
-                prox_stats = prox_stats.sort_values('sort_key').drop(columns=['sort_key'])
-                st.plotly_chart(plot_bar(prox_stats, 'Proximity Band', 'Win Rate by Distance from Nearest Zone'),
-                                use_container_width=True)
-                st.dataframe(prox_stats, use_container_width=True, hide_index=True)
-
-                # Proximity scatter plot
-                prox_data = setups[setups['zone_dist_pct'].notna()].copy()
-                if len(prox_data) > 5:
-                    fig_prox = go.Figure()
-                    wins_p = prox_data[prox_data['win_1r']==True]
-                    losses_p = prox_data[prox_data['win_1r']==False]
-                    fig_prox.add_trace(go.Scatter(
-                        x=wins_p['zone_dist_pct'], y=wins_p['max_favorable_r'],
-                        mode='markers', name='Wins',
-                        marker=dict(color='#00c853', size=8, opacity=0.6),
-                        text=[f"{r['datetime'].strftime('%Y-%m-%d %H:%M')}<br>"
-                              f"Zone: {r['nearest_zone_type']}<br>"
-                              f"Strength: {r['zone_strength']}×<br>"
-                              f"MFE: {r['max_favorable_r']:.1f}R"
-                              for _,r in wins_p.iterrows()],
-                        hoverinfo='text',
-                    ))
-                    fig_prox.add_trace(go.Scatter(
-                        x=losses_p['zone_dist_pct'], y=-losses_p['max_adverse_r'],
-                        mode='markers', name='Losses',
-                        marker=dict(color='#ff1744', size=8, opacity=0.6, symbol='x'),
-                        text=[f"{r['datetime'].strftime('%Y-%m-%d %H:%M')}<br>"
-                              f"Zone: {r['nearest_zone_type']}<br>"
-                              f"Strength: {r['zone_strength']}×<br>"
-                              f"MAE: {r['max_adverse_r']:.1f}R"
-                              for _,r in losses_p.iterrows()],
-                        hoverinfo='text',
-                    ))
-                    fig_prox.add_hline(y=0, line_dash="dash", line_color="gray", opacity=0.4)
-                    fig_prox.add_vline(x=zone_prox, line_dash="dot", line_color="#ffd700", opacity=0.6,
-                                       annotation_text=f"Proximity threshold ({zone_prox}%)")
-                    fig_prox.update_layout(
-                        title='Zone Distance vs Trade Outcome',
-                        xaxis_title='Distance to Nearest Zone (%)',
-                        yaxis_title='R-Multiple (positive=MFE, negative=MAE)',
-                        template='plotly_dark', height=450,
-                    )
-                    st.plotly_chart(fig_prox, use_container_width=True)
-
-                st.markdown("---")
-
-                # ── NEW: Zone Strength Analysis ──
-                st.subheader("💪 Zone Strength Analysis")
-                st.caption("Does the strength of the zone (how aggressive the originating candle was) affect win rate?")
-
-                strength_data = setups[setups['zone_strength'].notna()].copy()
-                if len(strength_data) > 5:
-                    # Bin zone strength
-                    strength_data['strength_band'] = pd.cut(
-                        strength_data['zone_strength'],
-                        bins=[0, 1.5, 2.0, 2.5, 3.0, float('inf')],
-                        labels=['1.0-1.5×', '1.5-2.0×', '2.0-2.5×', '2.5-3.0×', '3.0×+']
-                    ).astype(str)
-                    str_stats = seg_analysis(strength_data, 'strength_band', 'Zone Strength')
-                    st.plotly_chart(plot_bar(str_stats, 'Zone Strength', 'Win Rate by Zone Strength'),
-                                   use_container_width=True)
-                    st.dataframe(str_stats, use_container_width=True, hide_index=True)
-                else:
-                    st.info("Not enough zone-classified setups for strength analysis.")
-
-                st.markdown("---")
-
-                # ── NEW: Proximity × Direction × Zone Table ──
-                st.subheader("🔬 Proximity × Zone × Direction")
-                prox_rows = []
-                for band in setups['zone_proximity_band'].unique():
-                    for zt in setups['zone'].unique():
-                        for d in ['LONG', 'SHORT']:
-                            sub = setups[(setups['zone_proximity_band']==band)&
-                                        (setups['zone']==zt)&(setups['direction']==d)]
-                            if len(sub) >= 3:
-                                st3 = calc_stats(sub)
-                                prox_rows.append({
-                                    'Proximity': band, 'Zone': zt, 'Dir': d,
-                                    'Trades': st3['Trades'], 'WR%': st3['Win Rate'],
-                                    'PF': st3['PF'], 'Avg MFE': st3['Avg MFE']
-                                })
-                if prox_rows:
-                    prox_bd = pd.DataFrame(prox_rows).sort_values('WR%', ascending=False)
-                    st.dataframe(prox_bd, use_container_width=True, hide_index=True, height=400,
-                        column_config={'WR%': st.column_config.ProgressColumn('WR%', min_value=0, max_value=100, format="%.1f%%")})
-                else:
-                    st.info("Not enough data for cross-dimensional proximity analysis (need ≥3 trades per cell).")
-
-            with inner[3]:
-                ss=seg_analysis(setups,'session','Session')
-                st.plotly_chart(plot_bar(ss,'Session','Session Win Rate'),use_container_width=True)
-                dw=seg_analysis(setups,'day_name','Day')
-                dw['Day']=pd.Categorical(dw['Day'],['Mon','Tue','Wed','Thu','Fri'],ordered=True)
-                dw=dw.sort_values('Day')
-                st.plotly_chart(plot_bar(dw,'Day','Day of Week'),use_container_width=True)
-                ms=seg_analysis(setups,'month_name','Month')
-                mo=['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
-                ms['Month']=pd.Categorical(ms['Month'],mo,ordered=True); ms=ms.sort_values('Month')
-                st.plotly_chart(plot_bar(ms,'Month','Month'),use_container_width=True)
-                st.plotly_chart(plot_heatmap(setups,'day_name','hour',ro=['Mon','Tue','Wed','Thu','Fri'],
-                    title='Day × Hour Heatmap'),use_container_width=True)
-
-            with inner[4]:
-                ns=seg_analysis(setups,'news','Event')
-                st.plotly_chart(plot_bar(ns,'Event','News Impact'),use_container_width=True)
-                st.dataframe(ns,use_container_width=True,hide_index=True)
-
-            with inner[5]:
-                al=seg_analysis(setups,'alignment','Alignment')
-                st.plotly_chart(plot_bar(al,'Alignment','Trend Alignment'),use_container_width=True)
-
-                # Zone proximity as a dimension
-                st.subheader("Zone Proximity Dimension")
-                prx=seg_analysis(setups,'zone_proximity_band','Proximity')
-                band_order_map = {'Inside Zone':0,'Touching (≤0.1%)':1,'Very Close (0.1-0.3%)':2,
-                                  'Near (0.3-0.6%)':3,'Moderate (0.6-1%)':4,'Far (>1%)':5,'No Zone':6}
-                prx['_sort']=prx['Proximity'].map(band_order_map).fillna(99)
-                prx=prx.sort_values('_sort').drop(columns=['_sort'])
-                st.plotly_chart(plot_bar(prx,'Proximity','Win Rate by Zone Proximity'),use_container_width=True)
-                st.dataframe(prx,use_container_width=True,hide_index=True)
-
-                st.subheader("Multi-Dimensional Breakdown")
-                rows=[]
-                for z in setups['zone'].unique():
-                    for se in setups['session'].unique():
-                        for d in ['LONG','SHORT']:
-                            sub=setups[(setups['zone']==z)&(setups['session']==se)&(setups['direction']==d)]
-                            if len(sub)>=3:
-                                st2=calc_stats(sub)
-                                rows.append({'Zone':z,'Session':se,'Dir':d,'Trades':st2['Trades'],'WR%':st2['Win Rate'],'PF':st2['PF']})
-                if rows:
-                    bd=pd.DataFrame(rows).sort_values('WR%',ascending=False)
-                    st.dataframe(bd,use_container_width=True,hide_index=True,height=500,
-                        column_config={'WR%':st.column_config.ProgressColumn('WR%',min_value=0,max_value=100,format="%.1f%%")})
-                st.subheader("Statistical Significance")
-                nn=len(setups); ww=int(setups['win_1r'].sum())
-                bt=binomtest(ww,nn,0.5); ci=bt.proportion_ci(confidence_level=0.95)
-                st.markdown(f"**{ww/nn*100:.1f}%** ({ww}/{nn}) | p={bt.pvalue:.4f} | 95% CI: {ci.low*100:.1f}%-{ci.high*100:.1f}% | {'✅ Significant' if bt.pvalue<0.05 else '❌ Not significant'}")
-
-            with inner[6]:
-                st.subheader("📝 Complete Setup Log with Narratives")
-                f1,f2,f3,f4=st.columns(4)
-                with f1: fd=st.selectbox("Direction",['All','LONG','SHORT'],key=f"fd_{key}")
-                with f2: fz=st.selectbox("Zone",['All']+sorted(setups['zone'].unique().tolist()),key=f"fz_{key}")
-                with f3: fs=st.selectbox("Session",['All']+sorted(setups['session'].unique().tolist()),key=f"fs_{key}")
-                with f4: fr=st.selectbox("Result",['All','Wins','Losses'],key=f"fr_{key}")
-
-                fp1,fp2=st.columns(2)
-                with fp1:
-                    prox_opts=['All']+sorted(setups['zone_proximity_band'].unique().tolist())
-                    fpx=st.selectbox("Zone Proximity",prox_opts,key=f"fpx_{key}")
-                with fp2:
-                    if 'scenario_key' in setups.columns:
-                        scf_opts = ['All'] + sorted(setups['scenario_key'].unique().tolist())
-                    else:
-                        scf_opts = ['All']
-                    scf = st.selectbox("Scenario filter", scf_opts, key=f"sc_{key}")
-
-                filt=setups.copy()
-                if fd!='All': filt=filt[filt['direction']==fd]
-                if fz!='All': filt=filt[filt['zone']==fz]
-                if fs!='All': filt=filt[filt['session']==fs]
-                if fr=='Wins': filt=filt[filt['win_1r']==True]
-                elif fr=='Losses': filt=filt[filt['win_1r']==False]
-                if fpx!='All': filt=filt[filt['zone_proximity_band']==fpx]
-                if 'scenario_key' in filt.columns and scf!='All': filt=filt[filt['scenario_key']==scf]
-
-                srt=st.radio("Sort:",['Recent','Oldest','Best R','Worst R'],horizontal=True,key=f"sr_{key}")
-                if srt=='Recent': filt=filt.sort_values('datetime',ascending=False)
-                elif srt=='Oldest': filt=filt.sort_values('datetime',ascending=True)
-                elif srt=='Best R': filt=filt.sort_values('max_favorable_r',ascending=False)
-                else: filt=filt.sort_values('max_adverse_r',ascending=False)
-                st.markdown(f"**{len(filt)} of {len(setups)} setups**")
-
-                for idx,(_,s) in enumerate(filt.iterrows()):
-                    re="✅ WIN" if s['win_1r'] else "❌ LOSS"
-                    dist_txt = f" | Dist:{s['zone_dist_pct']:.2f}%" if pd.notna(s.get('zone_dist_pct')) else ""
-                    str_txt = f" Str:{s['zone_strength']:.1f}×" if pd.notna(s.get('zone_strength')) else ""
-                    with st.expander(
-                        f"**#{idx+1}** {s['datetime'].strftime('%a %b %d, %Y %H:%M')} | {s['direction']} | {re} | "
-                        f"{s['zone']}{dist_txt}{str_txt} | {s['session']} | C1:{s['c1_color']}/{s['c1_wick_bucket']} → C2:{s['c2_color']}/{s['c2_wick_bucket']}"):
-                        st.markdown(generate_narrative(s))
-                        st.markdown("---")
-
-                        # Zone detail box
-                        if s['zone'] != 'neutral':
-                            zc1,zc2,zc3=st.columns(3)
-                            with zc1:
-                                st.markdown(f"**🏗️ Zone Type:** {s['zone'].upper()}")
-                                if pd.notna(s.get('nearest_zone_top')):
-                                    st.markdown(f"**Zone Range:** ${s['nearest_zone_bottom']:.2f} — ${s['nearest_zone_top']:.2f}")
-                            with zc2:
-                                if pd.notna(s.get('zone_dist_pct')):
-                                    st.markdown(f"**Distance:** {s['zone_dist_pct']:.3f}%")
-                                    st.markdown(f"**Band:** {s['zone_proximity_band']}")
-                            with zc3:
-                                if pd.notna(s.get('zone_strength')):
-                                    st.markdown(f"**Strength:** {s['zone_strength']:.1f}× ATR")
-                                wz = ((s['zone']=='demand' and s['direction']=='LONG') or
-                                      (s['zone']=='supply' and s['direction']=='SHORT'))
-                                st.markdown(f"**Alignment:** {'✅ With Zone' if wz else '⚠️ Against Zone'}")
-                            st.markdown("---")
-
-                        co1,co2=st.columns(2)
-                        with co1:
-                            st.markdown(f"**C1** O:${s['c1_open']:.2f} C:${s['c1_close']:.2f} H:${s['c1_high']:.2f} L:${s['c1_low']:.2f}\n\n"
-                                f"Body:{s['c1_body_pct']:.1f}% UW:{s['c1_upper_wick_pct']:.1f}% LW:{s['c1_lower_wick_pct']:.1f}% | {s['c1_wick_label']}")
-                        with co2:
-                            st.markdown(f"**C2** O:${s['c2_open']:.2f} C:${s['c2_close']:.2f} H:${s['c2_high']:.2f} L:${s['c2_low']:.2f}\n\n"
-                                f"Body:{s['c2_body_pct']:.1f}% UW:{s['c2_upper_wick_pct']:.1f}% LW:{s['c2_lower_wick_pct']:.1f}% | {s['c2_wick_label']}")
-                        st.markdown(f"**C3 Breakout:** {s['c3_open']:.2f}→**{s['c3_close']:.2f}** "
-                            f"({'above C2 high '+str(round(s['c2_high'],2)) if s['direction']=='LONG' else 'below C2 low '+str(round(s['c2_low'],2))} "
-                            f"by ${s['c3_breakout_margin']:.2f}) → **{s['direction']}** | "
-                            f"Entry @ C3 close: **${s['entry_price']:.2f}** | SL:${s['stop_loss']:.2f} | Risk:${s['risk']:.2f}")
-                        # C4/C5/C6 follow-through
-                        fc1,fc2,fc3=st.columns(3)
-                        with fc1:
-                            c4f = "✅" if s.get('c4_followed') else "❌"
-                            st.markdown(f"**C4** {c4f} {s.get('c4_close_r',0):+.2f}R")
-                        with fc2:
-                            if s.get('c5_close_r') is not None:
-                                c5f = "✅" if s.get('c5_followed') else "❌"
-                                st.markdown(f"**C5** {c5f} {s['c5_close_r']:+.2f}R")
-                        with fc3:
-                            if s.get('c6_close_r') is not None:
-                                c6f = "✅" if s.get('c6_followed') else "❌"
-                                st.markdown(f"**C6** {c6f} {s['c6_close_r']:+.2f}R")
-                        st.markdown(f"**{s.get('follow_count',0)}/3 followed** | "
-                            f"1R:{'✅' if s['hit_1r'] else '❌'} 1.5R:{'✅' if s['hit_15r'] else '❌'} 2R:{'✅' if s['hit_2r'] else '❌'} | "
-                            f"MFE:{s['max_favorable_r']:.2f}R MAE:{s['max_adverse_r']:.2f}R")
-
-                st.markdown("---")
-                csv=filt.to_csv(index=False)
-                st.download_button(f"⬇️ CSV ({len(filt)} setups)",csv,f"setups_{key.replace(' ','_')}.csv","text/csv",key=f"dl_{key}")
-
-            with inner[7]:
-                ne=min(6,len(setups))
-                et=st.radio("Show:",['Recent','Best Winners','Worst Losers','Random'],horizontal=True,key=f"ex_{key}")
-                if et=='Recent': ex=setups.tail(ne)
-                elif et=='Best Winners': ex=setups[setups['win_1r']].nlargest(ne,'max_favorable_r')
-                elif et=='Worst Losers': ex=setups[~setups['win_1r']].nlargest(ne,'max_adverse_r')
-                else: ex=setups.sample(min(ne,len(setups)))
-                for _,s in ex.iterrows():
-                    st.plotly_chart(plot_candlestick_example(df,s),use_container_width=True,key=f"cx_{key}_{s['datetime']}")
-
-    if len(all_results)>1:
+    if len(all_results)>1 and not (lazy and not tabs[-1].open):
         with tabs[-1]:
             st.header("📋 Cross-Asset Comparison")
-            comp=[{**calc_stats(r['setups'],k),'Asset':r['asset'],'TF':r['tf']} for k,r in all_results.items()]
-            cd=pd.DataFrame(comp)
-            cd=cd[['Label','Asset','TF','Trades','Win Rate','PF','Avg R','Hit 1R%','Hit 1.5R%','Hit 2R%','Avg MFE','Avg MAE']].sort_values('Win Rate',ascending=False)
+            # One grouped pass over every result's stat columns instead of calc_stats per result
+            big=pd.concat([r['setups'][['pnl_r',*STAT_COLS]].assign(Label=k) for k,r in all_results.items()],ignore_index=True)
+            cd=seg_analysis(big,'Label','Label')
+            cd['Asset']=cd['Label'].map({k:r['asset'] for k,r in all_results.items()})
+            cd['TF']=cd['Label'].map({k:r['tf'] for k,r in all_results.items()})
+            cd=cd[['Label','Asset','TF','Trades','Win Rate','PF','Avg R','Hit 1R%','Hit 1.5R%','Hit 2R%','Avg MFE','Avg MAE']].sort_values('Win Rate',ascending=False,kind='stable')
             st.dataframe(cd,use_container_width=True,hide_index=True,
                 column_config={'Win Rate':st.column_config.ProgressColumn('Win Rate',min_value=0,max_value=100,format="%.1f%%")})
-            fig=go.Figure()
-            pal=list(COLORS.values())
-            for i,(k,r) in enumerate(all_results.items()):
-                s=r['setups']
-                fig.add_trace(go.Scatter(x=s['datetime'],y=s['cumulative_r'],mode='lines',name=k,line=dict(color=pal[i%len(pal)],width=2)))
-            fig.add_hline(y=0,line_dash="dash",line_color="gray",opacity=0.4)
-            fig.update_layout(title='Equity Curves',template='plotly_dark',height=450)
+            # Rebuild the equity overlay only when the set of results changes
+            sig=(st.session_state['run_params'],
+                 tuple((k,len(r['setups']),r['setups']['datetime'].iloc[-1]) for k,r in all_results.items()))
+            cached=st.session_state.get('cross_equity')
+            if cached and cached[0]==sig:
+                fig=cached[1]
+            else:
+                fig=go.Figure()
+                pal=list(COLORS.values())
+                for i,(k,r) in enumerate(all_results.items()):
+                    s=r['setups']
+                    fig.add_trace(go.Scatter(x=s['datetime'],y=s['cumulative_r'],mode='lines',name=k,line=dict(color=pal[i%len(pal)],width=2)))
+                fig.add_hline(y=0,line_dash="dash",line_color="gray",opacity=0.4)
+                fig.update_layout(title='Equity Curves',template='plotly_dark',height=450)
+                st.session_state['cross_equity']=(sig,fig)
             st.plotly_chart(fig,use_container_width=True)
             st.subheader("🏆 Top Scenarios Across All Assets")
-            asc=[]
-            for k,r in all_results.items():
-                s=r['setups']
-                for sc in s['scenario_key'].unique():
-                    sub=s[s['scenario_key']==sc]
-                    if len(sub)>=5:
-                        asc.append({'Asset':k,'Scenario':sc,'Trades':len(sub),'Win Rate':round(sub['win_1r'].mean()*100,1),'MFE':round(sub['max_favorable_r'].mean(),2)})
-            if asc:
-                asd=pd.DataFrame(asc).sort_values('Win Rate',ascending=False)
+            big=pd.concat([r['setups'][['scenario_key','win_1r','max_favorable_r']].assign(Asset=k) for k,r in all_results.items()],ignore_index=True)
+            g=big.groupby(['Asset','scenario_key'],observed=True,sort=False).agg(
+                n=('win_1r','size'),wr=('win_1r','mean'),mfe=('max_favorable_r','mean')).reset_index()
+            g=g[g['n']>=5]
+            asd=pd.DataFrame({'Asset':g['Asset'],'Scenario':g['scenario_key'].astype(str),'Trades':g['n'],
+                              'Win Rate':(g['wr']*100).round(1),'MFE':g['mfe'].round(2)}).sort_values('Win Rate',ascending=False,kind='stable')
+            if not asd.empty:
                 st.dataframe(asd.head(30),use_container_width=True,hide_index=True,
                     column_config={'Win Rate':st.column_config.ProgressColumn('Win Rate',min_value=0,max_value=100,format="%.1f%%")})
 
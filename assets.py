@@ -168,20 +168,19 @@ ASSET_CATEGORIES = {
     "🧪 Materials Stocks": STOCKS_MATERIALS,
 }
 
+# ─── LOOKUPS (built once at import) ───
+_DISPLAY_TO_TICKER = {display: ticker for cat_dict in ASSET_CATEGORIES.values()
+                      for display, ticker in cat_dict.items()}
+# Reversed so that a ticker listed in several categories maps to the first one
+_TICKER_TO_CATEGORY = {ticker: cat_name for cat_name, cat_dict in reversed(ASSET_CATEGORIES.items())
+                       for ticker in cat_dict.values()}
+
 
 def get_all_assets_flat():
     """Return a flat dict of all display_name -> ticker."""
-    out = {}
-    for cat_name, cat_dict in ASSET_CATEGORIES.items():
-        for display, ticker in cat_dict.items():
-            out[display] = ticker
-    return out
+    return dict(_DISPLAY_TO_TICKER)
 
 
 def get_category_for_ticker(ticker):
     """Return the category name for a given ticker."""
-    for cat_name, cat_dict in ASSET_CATEGORIES.items():
-        for display, t in cat_dict.items():
-            if t == ticker:
-                return cat_name
-    return "Unknown"
+    return _TICKER_TO_CATEGORY.get(ticker, "Unknown")
@@ -0,0 +1,24 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(scope="session")
+def ohlc():
+    """4000 synthetic hourly bars (random walk around 2000, a few zero-range candles)."""
+    rng = np.random.default_rng(7)
+    n = 4000
+    close = 2000 * np.exp(np.cumsum(rng.normal(0, 0.004, n)))
+    op = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.0005, n))
+    hi = np.maximum(op, close) * (1 + np.abs(rng.normal(0, 0.002, n)))
+    lo = np.minimum(op, close) * (1 - np.abs(rng.normal(0, 0.002, n)))
+    flat = rng.random(n) < 0.003
+    hi[flat] = lo[flat] = op[flat] = close[flat]
+    return pd.DataFrame({'Open': op.round(2), 'High': hi.round(2), 'Low': lo.round(2),
+                         'Close': close.round(2), 'Volume': rng.integers(100, 1000, n)},
+                        index=pd.date_range('2024-01-01', periods=n, freq='h'))
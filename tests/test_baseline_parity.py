@@ -0,0 +1,278 @@
+"""The vectorized detectors against the original row-by-row implementations.
+
+The reference loops below are the pre-vectorization code, kept as written except that they
+take the ATR array as an argument: the app now uses Wilder's ATR instead of a 14-bar rolling
+mean, and both sides must see the same ATR for the outputs to be comparable."""
+import numpy as np
+import pandas as pd
+
+import app7
+
+
+def app_atr(df):
+    H, L, C = (df[k].to_numpy(float) for k in ('High', 'Low', 'Close'))
+    return app7.wilder_atr(app7.true_range(H, L, C))
+
+
+def ref_detect_zones(df, atr, zone_atr_min=1.5):
+    df = df.copy()
+    df['Body'] = abs(df['Close'] - df['Open'])
+    df['ATR'] = atr
+    df['IsBullish'] = df['Close'] > df['Open']
+    zones = []
+    for i in range(20, len(df)):
+        r = df.iloc[i]
+        if pd.isna(r['ATR']) or r['ATR']==0 or r['Body'] < r['ATR']*zone_atr_min: continue
+        strength = r['Body'] / r['ATR']
+        if r['IsBullish']:
+            zones.append({'datetime':df.index[i],'zone_top':r['Open'],'zone_bottom':r['Low'],
+                         'zone_type':'demand','strength':round(strength,2),
+                         'origin_body':r['Body'],'origin_range':r['High']-r['Low']})
+        else:
+            zones.append({'datetime':df.index[i],'zone_top':r['High'],'zone_bottom':r['Open'],
+                         'zone_type':'supply','strength':round(strength,2),
+                         'origin_body':r['Body'],'origin_range':r['High']-r['Low']})
+    return pd.DataFrame(zones)
+
+
+def test_detect_zones_matches_loop(ohlc):
+    for zone_atr_min in (1.0, 1.5):
+        got = app7.detect_zones(ohlc, zone_atr_min)
+        want = ref_detect_zones(ohlc, app_atr(ohlc), zone_atr_min)
+        assert len(got) > 0
+        pd.testing.assert_frame_equal(got.reset_index(drop=True), want, check_dtype=False)
+
+
+def ref_classify_zone(dt, price, zones_df, lookback_hours=720, proximity_pct=0.003):
+    result = {'zone': 'neutral', 'zone_dist_pct': None, 'zone_strength': None,
+              'nearest_zone_type': None, 'nearest_zone_top': None, 'nearest_zone_bottom': None,
+              'zone_proximity_band': 'No Zone'}
+    if zones_df.empty:
+        return result
+    cutoff = dt - pd.Timedelta(hours=lookback_hours)
+    recent = zones_df[(zones_df['datetime']>=cutoff)&(zones_df['datetime']<dt)]
+    if recent.empty:
+        return result
+    near_s = near_d = False
+    min_dist_pct = float('inf')
+    nearest = None
+    for _, z in recent.iterrows():
+        if z['zone_bottom'] <= price <= z['zone_top']:
+            dist_pct = 0.0
+        else:
+            dist_top = abs(price - z['zone_top']) / price
+            dist_bot = abs(price - z['zone_bottom']) / price
+            dist_pct = min(dist_top, dist_bot)
+        if dist_pct < min_dist_pct:
+            min_dist_pct = dist_pct
+            nearest = z
+        if dist_pct <= proximity_pct:
+            if z['zone_type'] == 'supply':
+                near_s = True
+            else:
+                near_d = True
+    if near_s and near_d: zone_type = 'contested'
+    elif near_s: zone_type = 'supply'
+    elif near_d: zone_type = 'demand'
+    else: zone_type = 'neutral'
+    if min_dist_pct == 0: prox_band = 'Inside Zone'
+    elif min_dist_pct <= 0.001: prox_band = 'Touching (≤0.1%)'
+    elif min_dist_pct <= 0.003: prox_band = 'Very Close (0.1-0.3%)'
+    elif min_dist_pct <= 0.006: prox_band = 'Near (0.3-0.6%)'
+    elif min_dist_pct <= 0.01: prox_band = 'Moderate (0.6-1%)'
+    else: prox_band = 'Far (>1%)'
+    result['zone'] = zone_type
+    result['zone_dist_pct'] = round(min_dist_pct * 100, 3)
+    result['zone_proximity_band'] = prox_band
+    if nearest is not None:
+        result['zone_strength'] = nearest.get('strength', None)
+        result['nearest_zone_type'] = nearest['zone_type']
+        result['nearest_zone_top'] = nearest['zone_top']
+        result['nearest_zone_bottom'] = nearest['zone_bottom']
+    return result
+
+
+def test_classify_zones_batch_matches_loop(ohlc):
+    zones = app7.detect_zones(ohlc, 1.0)
+    probes = ohlc.iloc[::7]
+    for lookback, proximity in ((720, 0.003), (72, 0.01)):
+        got = pd.DataFrame(app7.classify_zones_batch(
+            probes.index.to_numpy('datetime64[ns]'), probes['Close'].to_numpy(float),
+            app7.prepare_zone_arrays(zones), lookback_hours=lookback, proximity_pct=proximity))
+        want = pd.DataFrame([ref_classify_zone(dt, px, zones, lookback, proximity)
+                             for dt, px in probes['Close'].items()])
+        assert set(want['zone']) >= {'neutral', 'supply', 'demand'}
+        want = want.astype({c: float for c in ('zone_dist_pct', 'zone_strength',
+                                                'nearest_zone_top', 'nearest_zone_bottom')})
+        pd.testing.assert_frame_equal(got, want, check_dtype=False)
+
+
+def ref_wick_profile(open_p, close_p, high, low):
+    body_top = max(open_p, close_p)
+    body_bot = min(open_p, close_p)
+    total_range = high - low
+    if total_range == 0:
+        return 'Doji', 0, 0, 0, close_p >= open_p
+    upper_pct = (high - body_top) / total_range * 100
+    lower_pct = (body_bot - low) / total_range * 100
+    body_pct = (body_top - body_bot) / total_range * 100
+    if body_pct < 10: label = 'Doji'
+    elif upper_pct > 30 and lower_pct > 30: label = 'Wicks Both Sides'
+    elif upper_pct > lower_pct * 2 and upper_pct > 20: label = 'Heavy Upper Wick'
+    elif lower_pct > upper_pct * 2 and lower_pct > 20: label = 'Heavy Lower Wick'
+    elif body_pct > 75: label = 'Full Body (Marubozu)'
+    elif upper_pct > lower_pct + 5: label = 'Slight Upper Wick'
+    elif lower_pct > upper_pct + 5: label = 'Slight Lower Wick'
+    else: label = 'Balanced'
+    return label, round(upper_pct, 1), round(lower_pct, 1), round(body_pct, 1), close_p > open_p
+
+
+def ref_wick_bucket(label):
+    if label in ('Heavy Upper Wick','Slight Upper Wick'): return 'Upper Wick'
+    if label in ('Heavy Lower Wick','Slight Lower Wick'): return 'Lower Wick'
+    if label == 'Full Body (Marubozu)': return 'Full Body'
+    if label == 'Wicks Both Sides': return 'Both Wicks'
+    if label == 'Doji': return 'Doji'
+    return 'Balanced'
+
+
+def ref_detect_setups(df, atr, body_ratio_thresh=0.65, atr_mult=1.3):
+    """Original detect_setups loop; follow_count counts truthy flags (the original `is True`
+    test never matched NumPy bools)."""
+    df = df.copy()
+    df['Body'] = abs(df['Close'] - df['Open'])
+    df['Range'] = df['High'] - df['Low']
+    df['BodyRatio'] = df['Body'] / df['Range'].replace(0, np.nan)
+    df['ATR'] = atr
+    setups = []
+    for i in range(14, len(df) - 6):
+        c1, c2, c3 = df.iloc[i], df.iloc[i+1], df.iloc[i+2]
+        if pd.isna(c1['ATR']) or c1['ATR']==0: continue
+        if c1['BodyRatio'] < body_ratio_thresh: continue
+        if c1['Body'] < c1['ATR'] * atr_mult: continue
+        if not (c2['High'] <= c1['High'] and c2['Low'] >= c1['Low']): continue
+        if c3['Close'] > c2['High']: direction = 'LONG'
+        elif c3['Close'] < c2['Low']: direction = 'SHORT'
+        else: continue
+        entry = c3['Close']
+        sl = c2['Low'] if direction=='LONG' else c2['High']
+        risk = entry - sl if direction=='LONG' else sl - entry
+        if risk <= 0: continue
+        c1_wl, c1_up, c1_lp, c1_bp, c1_bull = ref_wick_profile(c1['Open'],c1['Close'],c1['High'],c1['Low'])
+        c2_wl, c2_up, c2_lp, c2_bp, c2_bull = ref_wick_profile(c2['Open'],c2['Close'],c2['High'],c2['Low'])
+
+        def candle_result(candle):
+            if direction == 'LONG':
+                close_r = (candle['Close'] - entry) / risk
+                high_r = (candle['High'] - entry) / risk
+                low_r = (entry - candle['Low']) / risk
+                followed = candle['Close'] > entry
+            else:
+                close_r = (entry - candle['Close']) / risk
+                high_r = (entry - candle['Low']) / risk
+                low_r = (candle['High'] - entry) / risk
+                followed = candle['Close'] < entry
+            return {'close_r': round(close_r, 3), 'mfe_r': round(max(0, high_r), 3),
+                    'mae_r': round(max(0, low_r), 3), 'followed': followed}
+
+        res = {k: candle_result(df.iloc[i+k-1]) for k in (4, 5, 6)}
+        hit_1r=hit_15r=hit_2r=hit_sl=False
+        first_hit=None; mfe=0; mae=0
+        for j in range(i+3, min(i+23, len(df))):
+            c = df.iloc[j]
+            if direction=='LONG':
+                fav = (c['High']-entry)/risk; adv = (entry-c['Low'])/risk
+            else:
+                fav = (entry-c['Low'])/risk; adv = (c['High']-entry)/risk
+            mfe=max(mfe,fav); mae=max(mae,adv)
+            if direction=='LONG':
+                if c['Low']<=sl and not hit_sl:
+                    hit_sl=True
+                    if first_hit is None: first_hit='SL'
+                if c['High']>=entry+risk and not hit_1r:
+                    hit_1r=True
+                    if first_hit is None: first_hit='1R'
+                if c['High']>=entry+1.5*risk: hit_15r=True
+                if c['High']>=entry+2*risk: hit_2r=True
+            else:
+                if c['High']>=sl and not hit_sl:
+                    hit_sl=True
+                    if first_hit is None: first_hit='SL'
+                if c['Low']<=entry-risk and not hit_1r:
+                    hit_1r=True
+                    if first_hit is None: first_hit='1R'
+                if c['Low']<=entry-1.5*risk: hit_15r=True
+                if c['Low']<=entry-2*risk: hit_2r=True
+        win = hit_1r if first_hit=='1R' else (False if first_hit=='SL' else res[4]['close_r']>0)
+        margin = c3['Close'] - c2['High'] if direction == 'LONG' else c2['Low'] - c3['Close']
+        c1wb, c2wb = ref_wick_bucket(c1_wl), ref_wick_bucket(c2_wl)
+        row = {
+            'datetime': df.index[i],
+            'c1_open':c1['Open'],'c1_close':c1['Close'],'c1_high':c1['High'],'c1_low':c1['Low'],
+            'c1_body':c1['Body'],'c1_range':c1['Range'],'c1_body_ratio':c1['BodyRatio'],
+            'c1_bullish':c1_bull,'c1_atr':c1['ATR'],
+            'c1_wick_label':c1_wl,'c1_upper_wick_pct':c1_up,'c1_lower_wick_pct':c1_lp,'c1_body_pct':c1_bp,
+            'c1_wick_bucket': c1wb,
+            'c2_open':c2['Open'],'c2_close':c2['Close'],'c2_high':c2['High'],'c2_low':c2['Low'],
+            'c2_bullish':c2_bull,
+            'c2_wick_label':c2_wl,'c2_upper_wick_pct':c2_up,'c2_lower_wick_pct':c2_lp,'c2_body_pct':c2_bp,
+            'c2_wick_bucket': c2wb,
+            'c3_open':c3['Open'],'c3_close':c3['Close'],'c3_high':c3['High'],'c3_low':c3['Low'],
+            'c3_bullish':c3['Close'] > c3['Open'],
+            'c3_breakout_margin': round(margin, 2),
+            'c3_breakout_margin_pct': round(margin / entry * 100, 3),
+            'c3_breakout_margin_r': round(margin / risk, 3),
+            'direction': direction, 'entry_price':entry, 'stop_loss':sl,
+            'risk':risk, 'risk_pct':(risk/entry)*100,
+        }
+        for k in (4, 5, 6):
+            c = df.iloc[i+k-1]
+            row.update({f'c{k}_close_r': res[k]['close_r'], f'c{k}_mfe_r': res[k]['mfe_r'],
+                        f'c{k}_mae_r': res[k]['mae_r'], f'c{k}_followed': res[k]['followed'],
+                        f'c{k}_open': c['Open'], f'c{k}_close': c['Close'],
+                        f'c{k}_high': c['High'], f'c{k}_low': c['Low']})
+        row.update({
+            'follow_count': sum(1 for k in (4, 5, 6) if res[k]['followed']),
+            'hit_1r':hit_1r,'hit_15r':hit_15r,'hit_2r':hit_2r,'hit_sl':hit_sl,
+            'first_hit':first_hit,'win_1r':win,
+            'max_favorable_r':mfe,'max_adverse_r':mae,
+            'c1_direction_match': c1_bull == (direction=='LONG'),
+            'c1_color': 'Green' if c1_bull else 'Red',
+            'c2_color': 'Green' if c2_bull else 'Red',
+            'scenario_key': f"C1:{'Green' if c1_bull else 'Red'}/{c1wb} -> C2:{'Green' if c2_bull else 'Red'}/{c2wb}",
+        })
+        setups.append(row)
+    return pd.DataFrame(setups)
+
+
+def test_detect_setups_matches_loop(ohlc):
+    atr = app_atr(ohlc)
+    for body_ratio, atr_mult in ((0.65, 1.3), (0.5, 0.7)):
+        got = app7.detect_setups(ohlc, body_ratio, atr_mult)
+        want = ref_detect_setups(ohlc, atr, body_ratio, atr_mult)
+        assert len(got) > 0 and want['first_hit'].notna().any()
+        pd.testing.assert_frame_equal(got, want, check_dtype=False)
+
+
+def ref_wilder_atr(tr, period=14):
+    """Textbook Wilder recursion, one bar at a time, over the defined true ranges."""
+    out = [np.nan] * len(tr)
+    seen = []; atr = None
+    for t, x in enumerate(tr):
+        if np.isnan(x): continue
+        seen.append(x)
+        if len(seen) == period: atr = sum(seen) / period
+        elif len(seen) > period: atr = (atr * (period - 1) + x) / period
+        if atr is not None: out[t] = atr
+    return np.array(out)
+
+
+def test_wilder_atr_matches_recursion(ohlc):
+    H, L, C = (ohlc[k].to_numpy(float) for k in ('High', 'Low', 'Close'))
+    tr = app7.true_range(H, L, C)
+    assert np.isnan(tr[0]) and not np.isnan(tr[1:]).any()
+    for period in (14, 5):
+        got = app7.wilder_atr(tr, period)
+        np.testing.assert_allclose(got, ref_wilder_atr(tr, period), rtol=1e-9, equal_nan=True)
+        assert np.isnan(got[:period]).all() and not np.isnan(got[period:]).any()
+    assert np.isnan(app7.wilder_atr(tr[:10])).all()